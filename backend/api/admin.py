@@ -1,3 +1,37 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import CatalogVersion, Food, FoodPortion, MissingFood
+
+
+class FoodPortionInline(admin.TabularInline):
+    model = FoodPortion
+    extra = 0
+
+
+@admin.register(Food)
+class FoodAdmin(admin.ModelAdmin):
+    # Saves go through the post_save/post_delete signals, which refresh the
+    # snapshot and bump the CatalogVersion
+    list_display = ('name', 'calories_per_100g', 'unit')
+    search_fields = ('name',)
+    inlines = [FoodPortionInline]
+
+
+@admin.register(CatalogVersion)
+class CatalogVersionAdmin(admin.ModelAdmin):
+    list_display = ('counter', 'content_hash', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MissingFood)
+class MissingFoodAdmin(admin.ModelAdmin):
+    # Most requested first: candidates for the next catalog update
+    list_display = ('name', 'kind', 'count', 'first_seen', 'last_seen')
+    list_filter = ('kind',)
+    search_fields = ('name',)
+    ordering = ('-count',)
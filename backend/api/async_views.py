@@ -0,0 +1,120 @@
+"""
+Native async views for running under an ASGI server (see DEPLOY.md).
+
+DRF views are sync-only, so these are plain Django async views that perform
+the same JWT check DRF does before touching the request.
+"""
+
+import asyncio
+import json
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .food_logs import record_parsed_log
+from .jobs import enqueue_parse_job, job_payload, queued_response
+from .models import ParseJob
+from .timing import collect_timings, server_timing_header
+from .utils import aparse_long_food_log, total_nutrients
+
+
+async def authenticate_jwt(request):
+    """
+    Return the user for the request's Bearer token, or None.
+
+    The token check is pure CPU but loading the user hits the database, so the
+    whole thing runs in a thread.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if result is None:
+        return None
+    user, _token = result
+    return user
+
+
+@csrf_exempt # JWT in the Authorization header, no cookies involved
+async def parse_log_async(request):
+    if request.method != 'POST':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await authenticate_jwt(request)
+    if user is None or not user.is_active:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+
+    try:
+        data = json.loads(request.body)
+        if not data or 'foodLog' not in data:
+            return JsonResponse({"error": "Invalid request. 'foodLog' key is missing."}, status=400)
+
+        food_log = data['foodLog']
+        if request.GET.get('async') in ('1', 'true'):
+            job = await sync_to_async(enqueue_parse_job)(user, food_log)
+            return JsonResponse(queued_response(job), status=202)
+
+        with collect_timings() as timings:
+            parsed_items, total_calories, chunks = await aparse_long_food_log(food_log)
+
+        logs = await sync_to_async(record_parsed_log)(user, food_log, parsed_items, total_calories, chunks)
+        log_id = logs[0].id if logs else None
+
+        payload = {
+            "status": "success",
+            "log_id": log_id,
+            "parsed_items": parsed_items,
+            "total_calories": total_calories,
+            "total_nutrients": total_nutrients(parsed_items)
+        }
+        if chunks:
+            payload["chunks"] = chunks
+        response = JsonResponse(payload, status=200)
+        response['Server-Timing'] = server_timing_header(timings)
+        return response
+
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+
+
+async def parse_job_status(request, job_id):
+    """
+    Status of a queued parse; the result is included once it's done.
+
+    ?wait=N long-polls for up to N seconds (capped by PARSE_JOB_MAX_WAIT)
+    until the job finishes. It's an async view so waiting doesn't tie up a
+    worker thread under ASGI; sync WSGI workers are blocked for the whole
+    wait, which is why the cap defaults to 1 s there.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await authenticate_jwt(request)
+    if user is None or not user.is_active:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = math.nan
+    # A NaN deadline would never pass, so the request would poll forever
+    if not math.isfinite(wait):
+        return JsonResponse({"error": "wait must be a number of seconds"}, status=400)
+    wait = min(max(wait, 0), settings.PARSE_JOB_MAX_WAIT)
+
+    deadline = time.monotonic() + wait
+    while True:
+        job = await ParseJob.objects.filter(id=job_id, user=user).afirst()
+        if job is None:
+            return JsonResponse({"error": "Job not found"}, status=404)
+        if job.status in (ParseJob.DONE, ParseJob.FAILED) or time.monotonic() >= deadline:
+            return JsonResponse(job_payload(job))
+        await asyncio.sleep(settings.PARSE_JOB_POLL_INTERVAL)
@@ -0,0 +1,286 @@
+"""
+In-process snapshot of the Food catalog.
+
+The catalog is small and read on every tool call, so instead of querying the
+database per item we keep an immutable, versioned copy of it in memory.
+A new snapshot is built off to the side and swapped in with a single
+assignment, so readers always see either the old or the new catalog, never
+a half-built one.
+"""
+
+import threading
+import time
+from functools import cached_property
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+
+class CatalogEntry(NamedTuple):
+    id: int
+    name: str
+    calories_per_100g: int
+    unit: str
+
+
+# Columns of the nutrient matrices, all per 100 g
+NUTRIENT_FIELDS = ('calories_per_100g', 'protein_per_100g', 'carbs_per_100g', 'fat_per_100g', 'fiber_per_100g')
+MACRO_FIELDS = NUTRIENT_FIELDS[1:]
+# NumPy turns these into NaN in a float array
+UNKNOWN_MACROS = (None,) * len(MACRO_FIELDS)
+
+
+def normalize_name(name):
+    """Lower-case and collapse whitespace so 'Jollof  Rice ' == 'jollof rice'."""
+    return ' '.join(str(name).lower().split())
+
+
+class CatalogSnapshot:
+    """Read-only view of every Food row, keyed by normalized name."""
+
+    def __init__(self, entries, version, portions=None, popularity=None, macros=None):
+        # Entries are kept in the same order as Food.Meta.ordering (by name).
+        self.entries = tuple(sorted(entries, key=lambda e: e.name))
+        self.by_name = {normalize_name(e.name): e for e in self.entries}
+        # (food_id, canonical unit) -> grams, from FoodPortion
+        self.portions = portions or {}
+        # food_id -> times logged, for ranking suggestions
+        self.popularity = popularity or {}
+        # One row of NUTRIENT_FIELDS per entry, in entry order, so a parse's
+        # nutrients are a single fancy-index and multiply (see nutrients_for).
+        # Unknown macros (NULL) are NaN and stay NaN through the arithmetic.
+        macros = macros or {}
+        self.row_of = {e.id: row for row, e in enumerate(self.entries)}
+        self.nutrients = np.array(
+            [(e.calories_per_100g, *macros.get(e.id, UNKNOWN_MACROS)) for e in self.entries],
+            dtype=np.float64,
+        ).reshape(len(self.entries), len(NUTRIENT_FIELDS))
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name):
+        return self.by_name.get(normalize_name(name))
+
+    def get_many(self, names):
+        """Map each normalized name that exists in the catalog to its entry."""
+        by_name = self.by_name
+        return {name: by_name[name] for name in names if name in by_name}
+
+    def portions_for(self, food_ids):
+        return self.portions
+
+    def nutrients_for(self, foods):
+        """Per-100 g NUTRIENT_FIELDS of each entry in `foods`, as a new (n, 5) array."""
+        rows = [self.row_of.get(food.id, -1) for food in foods]
+        if -1 not in rows:
+            return self.nutrients.take(rows, axis=0)
+        # An entry from outside the snapshot (e.g. the Postgres fuzzy match)
+        return _nutrients_from_db(foods)
+
+    @cached_property
+    def fuzzy_index(self):
+        from api.fuzzy import TrigramIndex
+
+        # Built on first miss; positions line up with self.entries
+        return TrigramIndex(e.name for e in self.entries)
+
+    @cached_property
+    def matcher(self):
+        from api.matcher import FoodMatcher
+
+        return FoodMatcher(self.by_name)
+
+    @cached_property
+    def suggest_index(self):
+        from api.suggest import SuggestIndex
+
+        return SuggestIndex(self.entries, self.popularity)
+
+    @classmethod
+    def from_database(cls, version):
+        from api.models import Food, FoodPortion
+
+        rows = list(Food.objects.order_by().values_list(
+            'id', 'name', 'calories_per_100g', 'unit', *MACRO_FIELDS, 'times_logged'
+        ))
+        portions = {
+            (food_id, unit): grams
+            for food_id, unit, grams in FoodPortion.objects.values_list('food_id', 'unit', 'grams')
+        }
+        popularity = {row[0]: row[-1] for row in rows if row[-1]}
+        return cls(
+            [CatalogEntry(*row[:4]) for row in rows], version, portions, popularity,
+            macros={row[0]: row[4:-1] for row in rows},
+        )
+
+
+class DatabaseCatalog:
+    """
+    Same lookup interface as CatalogSnapshot, backed by queries.
+
+    Used when FOOD_CATALOG_SNAPSHOT is off (e.g. a catalog too large to hold in
+    every worker). Each call costs a fixed number of queries no matter how
+    many names are asked for. There is no name automaton, so the local parser
+    is skipped in this mode.
+    """
+
+    matcher = None
+    suggest_index = None
+
+    def __init__(self):
+        self.version = None
+        # food_id -> NUTRIENT_FIELDS of every row read so far, so
+        # nutrients_for() doesn't need a query of its own
+        self._nutrients = {}
+
+    def _entries_from(self, rows):
+        entries = []
+        for row in rows:
+            entries.append(CatalogEntry(*row[:4]))
+            self._nutrients[row[0]] = (row[2], *row[4:])
+        return entries
+
+    def get_many(self, names):
+        from api.models import Food
+
+        names = set(names)
+        if not names:
+            return {}
+        rows = Food.objects.order_by().filter(name__in=names).values_list(
+            'id', 'name', 'calories_per_100g', 'unit', *MACRO_FIELDS
+        )
+        return {normalize_name(e.name): e for e in self._entries_from(rows)}
+
+    def get(self, name):
+        return self.get_many([normalize_name(name)]).get(normalize_name(name))
+
+    def portions_for(self, food_ids):
+        from api.models import FoodPortion
+
+        food_ids = set(food_ids)
+        if not food_ids:
+            return {}
+        rows = FoodPortion.objects.filter(food_id__in=food_ids).values_list('food_id', 'unit', 'grams')
+        return {(food_id, unit): grams for food_id, unit, grams in rows}
+
+    def nutrients_for(self, foods):
+        foods = list(foods)
+        if all(food.id in self._nutrients for food in foods):
+            return np.array([self._nutrients[food.id] for food in foods], dtype=np.float64).reshape(
+                len(foods), len(NUTRIENT_FIELDS)
+            )
+        return _nutrients_from_db(foods)
+
+    @cached_property
+    def entries(self):
+        from api.models import Food
+
+        rows = Food.objects.values_list('id', 'name', 'calories_per_100g', 'unit', *MACRO_FIELDS)
+        return tuple(self._entries_from(rows))
+
+    @cached_property
+    def fuzzy_index(self):
+        from api.fuzzy import TrigramIndex
+
+        return TrigramIndex(e.name for e in self.entries)
+
+
+def _nutrients_from_db(foods):
+    """nutrients_for() with one query, for entries not held in a snapshot."""
+    from api.models import Food
+
+    foods = list(foods)
+    rows = {
+        row[0]: row[1:]
+        for row in Food.objects.filter(id__in={food.id for food in foods}).values_list('id', *NUTRIENT_FIELDS)
+    }
+    return np.array(
+        [rows.get(food.id, (food.calories_per_100g, *UNKNOWN_MACROS)) for food in foods], dtype=np.float64
+    ).reshape(len(foods), len(NUTRIENT_FIELDS))
+
+
+_snapshot = None
+_version = 0
+_stale = False
+_lock = threading.Lock()
+
+
+def _ttl():
+    # Other processes (management commands, other gunicorn workers) can change
+    # the catalog without our signals firing, so snapshots expire eventually.
+    return getattr(settings, 'FOOD_CATALOG_TTL', 300)
+
+
+def get_catalog():
+    """Return the current snapshot, building it on first use or after expiry."""
+    index_path = getattr(settings, 'FOOD_CATALOG_INDEX_PATH', '')
+    if index_path:
+        from api.catalog_index import get_mapped_catalog
+
+        # Until build_catalog_index has written the file, fall through
+        mapped = get_mapped_catalog(index_path)
+        if mapped is not None:
+            return mapped
+    if not getattr(settings, 'FOOD_CATALOG_SNAPSHOT', True):
+        return DatabaseCatalog()
+    snapshot = _snapshot
+    if snapshot is None or _stale or time.monotonic() - snapshot.built_at > _ttl():
+        snapshot = refresh_catalog(replacing=snapshot, force=False)
+    return snapshot
+
+
+def refresh_catalog(replacing=None, force=True):
+    """Rebuild the snapshot from the database and swap it in atomically."""
+    global _snapshot, _version, _stale
+    with _lock:
+        if not force and _snapshot is not replacing and not _stale:
+            # Another thread rebuilt it while we were waiting for the lock.
+            return _snapshot
+        _stale = False
+        snapshot = CatalogSnapshot.from_database(_version + 1)
+        _version = snapshot.version
+        _snapshot = snapshot
+    return snapshot
+
+
+def _mark_stale():
+    global _stale
+    _stale = True
+
+
+def _catalog_changed():
+    from api.versioning import bump_version
+
+    _mark_stale()
+    bump_version()
+
+
+def invalidate_catalog():
+    """
+    Mark the snapshot stale and bump the catalog version once the current
+    transaction (if any) commits.
+
+    Only one callback is registered per transaction, so a command that saves
+    a hundred rows bumps the version once and the next reader pays for one
+    rebuild instead of one per row.
+    """
+    connection = transaction.get_connection()
+    # Rolling back a savepoint drops the callbacks registered inside it, so a
+    # pending one still in the list is only lost if this change is lost too
+    # (update_or_create() opens a savepoint per row, hence not comparing them)
+    if connection.in_atomic_block and any(
+        getattr(func, 'catalog_change_pending', False) for _, func, _ in connection.run_on_commit
+    ):
+        return
+
+    def catalog_change():
+        catalog_change.catalog_change_pending = False
+        _catalog_changed()
+
+    catalog_change.catalog_change_pending = True
+    transaction.on_commit(catalog_change, robust=True)
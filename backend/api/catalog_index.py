@@ -0,0 +1,266 @@
+"""
+On-disk catalog index that gunicorn workers share through mmap.
+
+`manage.py build_catalog_index` writes the Food table into one file of
+fixed-width arrays plus a blob of names. With FOOD_CATALOG_INDEX_PATH set,
+every worker maps that file read-only and looks names up by binary search
+straight in the mapping: nothing is loaded at startup, and all processes
+share a single copy in the page cache instead of each building its own
+snapshot.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    header          magic, format version, food count, portion count,
+                    name blob size, catalog content hash
+    name_offsets    u64 x (count + 1), start of each name in the blob
+    ids             i64 x count, Food id of each row
+    id_order        i64 x count x 2, (id, row) pairs sorted by id
+    nutrients       f64 x count x 5, NUTRIENT_FIELDS per row (NaN if unknown)
+    units           24 bytes x count, NUL-padded UTF-8
+    portion_rows    i64 x portions, row of each portion, sorted
+    portion_grams   f64 x portions
+    portion_units   24 bytes x portions
+    names           UTF-8 names, sorted by their bytes
+
+Rows are sorted by normalized name, so row i's name is
+names[name_offsets[i]:name_offsets[i + 1]].
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+
+from api.catalog import NUTRIENT_FIELDS, CatalogEntry, _nutrients_from_db, normalize_name
+
+MAGIC = b'HACATIX1'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIQQ64s')
+UNIT_WIDTH = 24
+# How often a worker checks whether the file was replaced by a rebuild
+RECHECK_SECONDS = 1.0
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def write_index(path, foods, portions, content_hash=''):
+    """
+    Write an index file for `foods` and swap it in atomically.
+
+    `foods` yields (id, name, unit, *NUTRIENT_FIELDS) rows; `portions` yields
+    (food_id, unit, grams). Returns the number of foods written.
+    """
+    rows = {}
+    for food_id, name, unit, *nutrients in foods:
+        key = normalize_name(name).encode('utf-8')
+        if key and key not in rows:
+            rows[key] = (food_id, unit, nutrients)
+    names = sorted(rows)
+    count = len(names)
+
+    offsets = np.zeros(count + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(name) for name in names], dtype=np.uint64)
+    ids = np.array([rows[name][0] for name in names], dtype='<i8')
+    order = np.argsort(ids, kind='stable')
+    id_order = np.column_stack([ids[order], order]).astype('<i8')
+    nutrients = np.array([rows[name][2] for name in names], dtype='<f8').reshape(count, len(NUTRIENT_FIELDS))
+    units = np.array([rows[name][1].encode('utf-8') for name in names], dtype=f'S{UNIT_WIDTH}')
+
+    row_of = {rows[name][0]: row for row, name in enumerate(names)}
+    portion_list = sorted(
+        (row_of[food_id], unit, grams) for food_id, unit, grams in portions if food_id in row_of
+    )
+    portion_rows = np.array([p[0] for p in portion_list], dtype='<i8')
+    portion_grams = np.array([p[2] for p in portion_list], dtype='<f8')
+    portion_units = np.array([p[1].encode('utf-8') for p in portion_list], dtype=f'S{UNIT_WIDTH}')
+    blob = b''.join(names)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, count, len(portion_list), len(blob), content_hash.encode('ascii'))
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            for array in (offsets, ids, id_order, nutrients, units, portion_rows, portion_grams, portion_units):
+                data = array.tobytes()
+                f.write(data + b'\0' * (_align(len(data)) - len(data)))
+            f.write(blob)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    # Workers that still have the old file mapped keep reading it until they
+    # notice the new one
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_header(path):
+    """(count, portion count, content hash) of an index file, or None if it isn't one."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, count, portion_count, _, content_hash = HEADER.unpack(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return count, portion_count, content_hash.rstrip(b'\0').decode('ascii')
+
+
+class MappedCatalog:
+    """
+    Same lookup interface as CatalogSnapshot, read from a mapped index file.
+
+    Like DatabaseCatalog there is no name automaton (so no local parser) and
+    no suggestion index. Fuzzy matching uses pg_trgm on Postgres; elsewhere
+    the first miss builds a trigram index over every name in this worker.
+    """
+
+    matcher = None
+    suggest_index = None
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, portion_count, blob_size, content_hash = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a catalog index (format {FORMAT_VERSION})")
+        self.count = count
+        self.version = content_hash.rstrip(b'\0').decode('ascii')
+
+        position = HEADER.size
+
+        def section(dtype, shape):
+            nonlocal position
+            array = np.frombuffer(self._mm, dtype=dtype, count=int(np.prod(shape)), offset=position).reshape(shape)
+            position += _align(array.nbytes)
+            return array
+
+        view = memoryview(self._mm)
+        self._offsets = view[position:position + (count + 1) * 8].cast('Q')
+        section('<u8', (count + 1,))
+        self._ids = section('<i8', (count,))
+        self._id_order = section('<i8', (count, 2))
+        self.nutrients = section('<f8', (count, len(NUTRIENT_FIELDS)))
+        self._units = section(f'S{UNIT_WIDTH}', (count,))
+        self._portion_rows = section('<i8', (portion_count,))
+        self._portion_grams = section('<f8', (portion_count,))
+        self._portion_units = section(f'S{UNIT_WIDTH}', (portion_count,))
+        self._names_start = position
+        self.path = path
+
+    def __len__(self):
+        return self.count
+
+    def _name(self, row):
+        start = self._names_start
+        return self._mm[start + self._offsets[row]:start + self._offsets[row + 1]]
+
+    def _find(self, name):
+        """Row of a normalized name, or -1."""
+        key = name.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.count and self._name(lo) == key else -1
+
+    def _entry(self, row):
+        return CatalogEntry(
+            int(self._ids[row]),
+            self._name(row).decode('utf-8'),
+            int(self.nutrients[row, 0]),
+            self._units[row].decode('utf-8'),
+        )
+
+    def _rows_for_ids(self, food_ids):
+        ids = np.asarray(food_ids, dtype=np.int64)
+        sorted_ids = self._id_order[:, 0]
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), max(self.count - 1, 0))
+        found = sorted_ids[positions] == ids if self.count else np.zeros(len(ids), dtype=bool)
+        return np.where(found, self._id_order[positions, 1] if self.count else -1, -1)
+
+    def get(self, name):
+        row = self._find(normalize_name(name))
+        return self._entry(row) if row >= 0 else None
+
+    def get_many(self, names):
+        found = {}
+        for name in names:
+            row = self._find(name)
+            if row >= 0:
+                found[name] = self._entry(row)
+        return found
+
+    def portions_for(self, food_ids):
+        food_ids = list(set(food_ids))
+        portions = {}
+        if not food_ids or not len(self._portion_rows):
+            return portions
+        for food_id, row in zip(food_ids, self._rows_for_ids(food_ids).tolist()):
+            if row < 0:
+                continue
+            lo = np.searchsorted(self._portion_rows, row, 'left')
+            hi = np.searchsorted(self._portion_rows, row, 'right')
+            for i in range(lo, hi):
+                portions[(food_id, self._portion_units[i].decode('utf-8'))] = float(self._portion_grams[i])
+        return portions
+
+    def nutrients_for(self, foods):
+        foods = list(foods)
+        rows = self._rows_for_ids([food.id for food in foods])
+        if (rows < 0).any():
+            # A food added after the index was built (e.g. a Postgres fuzzy match)
+            return _nutrients_from_db(foods)
+        return self.nutrients.take(rows, axis=0)
+
+    @cached_property
+    def entries(self):
+        return tuple(self._entry(row) for row in range(self.count))
+
+    @cached_property
+    def fuzzy_index(self):
+        from api.fuzzy import TrigramIndex
+
+        return TrigramIndex(e.name for e in self.entries)
+
+
+_mapped = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_mapped_catalog(path):
+    """
+    The MappedCatalog for `path`, reopened when a rebuild replaced the file.
+
+    Returns None while there is no index file, so callers fall back to the
+    snapshot.
+    """
+    global _mapped, _checked_at
+    mapped = _mapped
+    now = time.monotonic()
+    if mapped is not None and mapped.path == path and now - _checked_at < RECHECK_SECONDS:
+        return mapped
+    with _lock:
+        _checked_at = now
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _mapped = None
+            return None
+        identity = (path, stat.st_ino, stat.st_mtime_ns)
+        if _mapped is None or getattr(_mapped, 'identity', None) != identity:
+            _mapped = MappedCatalog(path)
+            _mapped.identity = identity
+        return _mapped
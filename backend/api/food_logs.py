@@ -0,0 +1,169 @@
+"""
+Storing parsed logs and keeping the per-day totals up to date.
+"""
+
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import DailyTotal, Food, FoodLog, FoodLogItem
+from api.utils import split_log_chunks
+
+QUANTITY_MAX_LENGTH = FoodLogItem._meta.get_field('quantity').max_length
+
+
+def _clip(text, max_length):
+    # The unit part of a quantity is free-form LLM output; Postgres would
+    # reject an over-long one with a DataError after the LLM call was paid for
+    text = str(text)
+    return text if len(text) <= max_length else text[:max_length - 1] + '…'
+
+
+def record_food_log(user, text, parsed_items, total_calories, logged_on=None):
+    """
+    Save a parsed log with its items and add it to the user's DailyTotal.
+
+    Everything happens in one transaction, so the rollup can never drift from
+    the items it summarizes.
+    """
+    return _save_log(user, text, parsed_items, total_calories, logged_on or timezone.localdate())
+
+
+def chunk_date(label, today):
+    """
+    The day a chunk's label names, or None.
+
+    Only labels that pin down one past day count: "2024-05-01", "today" and
+    "yesterday". "Monday" or "Day 2" could be any week, and a future date is
+    a plan, not something eaten.
+    """
+    label = (label or '').lower()
+    if label == 'today':
+        return today
+    if label == 'yesterday':
+        return today - timedelta(days=1)
+    try:
+        day = date.fromisoformat(label)
+    except ValueError:
+        return None
+    return day if day <= today else None
+
+
+def record_parsed_log(user, text, parsed_items, total_calories, chunks):
+    """
+    Save what parse_long_food_log() returned. Returns the saved FoodLogs.
+
+    A log parsed in one piece is today's. A multi-day log is saved one FoodLog
+    per dated day instead, under that date. The chunks whose day is unknown go
+    into one undated FoodLog that counts toward no day's total. Each chunk
+    summary gets the id of the log its items were saved in.
+    """
+    if not parsed_items:
+        return []
+    if not chunks:
+        return [record_food_log(user, text, parsed_items, total_calories)]
+
+    today = timezone.localdate()
+    # Same input, same chunks as parse_long_food_log() used
+    texts = [chunk["text"] for chunk in split_log_chunks(text)]
+    days = {}
+    for summary in chunks:
+        day = days.setdefault(chunk_date(summary["label"], today), {"chunks": [], "items": []})
+        day["chunks"].append(summary)
+    for item in parsed_items:
+        days[chunk_date(chunks[item["chunk"]]["label"], today)]["items"].append(item)
+
+    logs = []
+    for logged_on, day in days.items():
+        if not day["items"]:
+            continue
+        log = _save_log(
+            user,
+            "\n".join(texts[summary["chunk"]] for summary in day["chunks"]),
+            day["items"],
+            round(sum(item["total_calories"] for item in day["items"]), 2),
+            logged_on,
+        )
+        for summary in day["chunks"]:
+            if summary.get("item_count"):
+                summary["log_id"] = log.id
+        logs.append(log)
+    return logs
+
+
+def _save_log(user, text, parsed_items, total_calories, logged_on):
+    # logged_on None: an undated log, kept out of every DailyTotal
+    food_ids = dict(
+        Food.objects.filter(name__in={item["item"] for item in parsed_items}).values_list('name', 'id')
+    )
+
+    with transaction.atomic():
+        log = FoodLog.objects.create(
+            user=user, text=text, logged_on=logged_on, total_calories=total_calories
+        )
+        FoodLogItem.objects.bulk_create([
+            FoodLogItem(
+                log=log,
+                food_id=food_ids.get(item["item"]),
+                name=item["item"],
+                quantity=_clip(item["quantity"], QUANTITY_MAX_LENGTH),
+                grams=item.get("grams", 0),
+                calories=item["total_calories"],
+                source=item.get("source", ""),
+            )
+            for item in parsed_items
+        ])
+
+        # One UPDATE per distinct count, usually just one
+        foods_by_count = {}
+        for food_id, count in Counter(
+            food_ids[item["item"]] for item in parsed_items if item["item"] in food_ids
+        ).items():
+            foods_by_count.setdefault(count, []).append(food_id)
+        for count, ids in foods_by_count.items():
+            Food.objects.filter(pk__in=ids).update(times_logged=F('times_logged') + count)
+
+        if logged_on is not None:
+            daily, _ = DailyTotal.objects.get_or_create(user=user, date=logged_on)
+            # F() expressions so concurrent requests for the same day add up correctly
+            DailyTotal.objects.filter(pk=daily.pk).update(
+                total_calories=F('total_calories') + total_calories,
+                item_count=F('item_count') + len(parsed_items),
+                log_count=F('log_count') + 1,
+            )
+    return log
+
+
+def daily_totals(user, start, end):
+    """Totals for every day from start to end inclusive, zeros for empty days."""
+    rows = {
+        row.date: row
+        for row in DailyTotal.objects.filter(user=user, date__gte=start, date__lte=end)
+    }
+    days = []
+    day = start
+    while day <= end:
+        row = rows.get(day)
+        days.append({
+            "date": day.isoformat(),
+            "total_calories": round(row.total_calories, 2) if row else 0,
+            "item_count": row.item_count if row else 0,
+            "log_count": row.log_count if row else 0,
+        })
+        day += timedelta(days=1)
+    return days
+
+
+def parse_date_range(start, end, max_days=366):
+    """Validate ?start=&end= query params (ISO dates). Raises ValueError."""
+    today = timezone.localdate()
+    end = date.fromisoformat(end) if end else today
+    start = date.fromisoformat(start) if start else end
+    if start > end:
+        raise ValueError("start must not be after end")
+    if (end - start).days >= max_days:
+        raise ValueError(f"range can't be longer than {max_days} days")
+    return start, end
@@ -0,0 +1,146 @@
+"""
+Fuzzy food-name matching.
+
+Scores use the same trigram similarity as Postgres' pg_trgm extension, so the
+in-memory index (used on SQLite and in tests) and the GIN-indexed database
+query rank candidates identically.
+"""
+
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """Trigram set of `text`, padded per word the way pg_trgm does it."""
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def similarity(a, b):
+    """pg_trgm similarity(): shared trigrams over the union of both sets."""
+    ga, gb = trigrams(a), trigrams(b)
+    if not ga or not gb:
+        return 0.0
+    shared = len(ga & gb)
+    return shared / (len(ga) + len(gb) - shared)
+
+
+class TrigramIndex:
+    """Inverted index from trigram to the positions of the names containing it."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for position, name in enumerate(self.names):
+            grams = trigrams(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(position)
+
+    def search(self, query, threshold=0.3, limit=5):
+        """Return up to `limit` (position, score) pairs, best first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for position in self.postings.get(gram, ()):
+                shared[position] += 1
+
+        size = len(query_grams)
+        scored = []
+        for position, count in shared.items():
+            score = count / (size + self.sizes[position] - count)
+            if score >= threshold:
+                scored.append((position, score))
+
+        # Ties go to the shorter (less specific) name, then alphabetical order
+        scored.sort(key=lambda ps: (-ps[1], len(self.names[ps[0]]), self.names[ps[0]]))
+        return scored[:limit]
+
+    def best(self, query, threshold=0.3):
+        results = self.search(query, threshold, limit=1)
+        return results[0] if results else None
+
+
+def _threshold():
+    return getattr(settings, 'FOOD_FUZZY_THRESHOLD', 0.3)
+
+
+def _use_postgres():
+    backend = getattr(settings, 'FOOD_FUZZY_BACKEND', 'auto')
+    if backend == 'auto':
+        return connection.vendor == 'postgresql'
+    return backend == 'postgres'
+
+
+def _postgres_best_many(names, threshold):
+    """One query for every name: a LATERAL top-1 trigram search per name."""
+    from api.catalog import CatalogEntry
+
+    # `%` is pg_trgm's similarity operator; it is what lets the planner use the
+    # api_food_name_trgm GIN index instead of scanning every row. It compares
+    # against pg_trgm.similarity_threshold (0.3 by default), so set that to
+    # FOOD_FUZZY_THRESHOLD for this transaction only.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", [str(threshold)])
+        cursor.execute(
+            "SELECT q.name, f.id, f.name, f.calories_per_100g, f.unit, f.score "
+            "FROM unnest(%s::text[]) AS q(name) "
+            "CROSS JOIN LATERAL ("
+            "  SELECT id, name, calories_per_100g, unit, similarity(name, q.name) AS score "
+            "  FROM api_food WHERE name %% q.name "
+            "  ORDER BY score DESC, length(name), name LIMIT 1"
+            ") AS f",
+            [list(names)],
+        )
+        rows = cursor.fetchall()
+    return {
+        row[0]: (CatalogEntry(*row[1:5]), row[5])
+        for row in rows
+        if row[5] >= threshold
+    }
+
+
+def best_matches(catalog, names):
+    """
+    Find the closest catalog entry for each name.
+
+    Returns {name: (entry, score)}; names with nothing similar enough are
+    left out. Costs at most one query regardless of how many names are given.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    threshold = _threshold()
+    if _use_postgres():
+        return _postgres_best_many(names, threshold)
+
+    index = catalog.fuzzy_index
+    matches = {}
+    for name in names:
+        result = index.best(name, threshold)
+        if result is not None:
+            position, score = result
+            matches[name] = (catalog.entries[position], score)
+    return matches
+
+
+def best_match(catalog, name):
+    """
+    Find the closest catalog entry to `name`.
+
+    Returns (entry, score) or None when nothing is similar enough.
+    """
+    return best_matches(catalog, [name]).get(name)
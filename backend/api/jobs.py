@@ -0,0 +1,124 @@
+"""
+Database-backed queue for /parse-log?async=1.
+
+The request only inserts a ParseJob row; `manage.py parse_worker` processes
+claim pending jobs and run the normal parse. Claiming is a conditional
+UPDATE (status still pending), so any number of workers can poll the same
+table without a broker or row locks. A job whose worker died is put back
+after PARSE_JOB_TIMEOUT seconds, up to PARSE_JOB_MAX_ATTEMPTS times.
+"""
+
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from api.food_logs import record_parsed_log
+from api.models import ParseJob
+from api.timing import collect_timings
+from api.utils import parse_long_food_log, total_nutrients
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_parse_job(user, text):
+    return ParseJob.objects.create(user=user, text=text)
+
+
+def claim_job(worker):
+    """Claim the oldest pending job for this worker, or return None."""
+    while True:
+        job_id = (
+            ParseJob.objects.filter(status=ParseJob.PENDING)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = ParseJob.objects.filter(id=job_id, status=ParseJob.PENDING).update(
+            status=ParseJob.RUNNING,
+            worker=worker,
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ParseJob.objects.get(id=job_id)
+        # Another worker got there first; try the next one
+
+
+def run_job(job):
+    """Parse the job's log, save it like the sync endpoint does, and store the result."""
+    try:
+        with collect_timings() as timings:
+            parsed_items, total_calories, chunks = parse_long_food_log(job.text)
+        logs = record_parsed_log(job.user, job.text, parsed_items, total_calories, chunks)
+        log_id = logs[0].id if logs else None
+    except Exception as e:
+        finish_job(job, ParseJob.FAILED, error=str(e))
+        return False
+
+    result = {
+        "log_id": log_id,
+        "parsed_items": parsed_items,
+        "total_calories": total_calories,
+        "total_nutrients": total_nutrients(parsed_items),
+        "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+    }
+    if chunks:
+        result["chunks"] = chunks
+    finish_job(job, ParseJob.DONE, result=result)
+    return True
+
+
+def finish_job(job, status, result=None, error=''):
+    # Only if it's still ours: a job requeued after a timeout may have moved on
+    ParseJob.objects.filter(id=job.id, status=ParseJob.RUNNING, worker=job.worker).update(
+        status=status, result=result, error=error, finished_at=timezone.now()
+    )
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker stopped answering; give up after max attempts."""
+    cutoff = timezone.now() - timedelta(seconds=_setting('PARSE_JOB_TIMEOUT', 120))
+    stale = ParseJob.objects.filter(status=ParseJob.RUNNING, claimed_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=_setting('PARSE_JOB_MAX_ATTEMPTS', 3)).update(
+        status=ParseJob.FAILED, error='Worker timed out', finished_at=timezone.now()
+    )
+    requeued = stale.update(status=ParseJob.PENDING, worker='')
+    return requeued, failed
+
+
+def delete_old_jobs():
+    cutoff = timezone.now() - timedelta(days=_setting('PARSE_JOB_RETENTION_DAYS', 7))
+    deleted, _ = ParseJob.objects.filter(
+        status__in=[ParseJob.DONE, ParseJob.FAILED], finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def queued_response(job):
+    return {"status": "queued", "job_id": job.id, "status_url": f"/parse-log/jobs/{job.id}"}
+
+
+def job_payload(job):
+    data = {
+        "job_id": job.id,
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == ParseJob.DONE:
+        data.update(job.result or {})
+    elif job.status == ParseJob.FAILED:
+        data["error"] = job.error
+    return data
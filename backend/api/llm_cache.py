@@ -0,0 +1,177 @@
+"""
+Two-tier cache for LLM extractions.
+
+People log the same meals every day, so the (food_name, quantity, unit)
+arguments the model extracts are cached by normalized log text plus prompt
+version. Every provider returns the same normalized arguments, so the key
+doesn't depend on who answered; LLMExtraction.model records that instead
+("openai:gpt-4o-mini", "gemini:gemini-2.0-flash"). Calories are not cached:
+they are looked up fresh each time, so catalog edits still apply to cached
+extractions.
+
+Tier 1 is a per-process LRU with a TTL. Tier 2 is the LLMExtraction table,
+which survives restarts and is shared by every gunicorn worker.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+
+def normalize_log_text(log_text):
+    return ' '.join(log_text.lower().split())
+
+
+def cache_key(log_text, prompt_version):
+    raw = f"{prompt_version}|{normalize_log_text(log_text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry time-to-live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ExtractionCache:
+    def __init__(self):
+        self.memory = LRUCache(
+            getattr(settings, 'LLM_CACHE_MEMORY_SIZE', 1024),
+            getattr(settings, 'LLM_CACHE_MEMORY_TTL', 3600),
+        )
+        self.counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _db_ttl(self):
+        return timedelta(seconds=getattr(settings, 'LLM_CACHE_DB_TTL', 30 * 24 * 3600))
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        from api.models import LLMExtraction
+
+        cutoff = timezone.now() - self._db_ttl()
+        row = LLMExtraction.objects.filter(key=key, created_at__gte=cutoff).first()
+        if row is None:
+            self._count('misses')
+            return None
+
+        LLMExtraction.objects.filter(pk=row.pk).update(hit_count=F('hit_count') + 1, last_hit_at=timezone.now())
+        self.memory.set(key, row.extracted)
+        self._count('db_hits')
+        return row.extracted
+
+    async def aget(self, key):
+        """Async version of get() using the async ORM."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        from api.models import LLMExtraction
+
+        cutoff = timezone.now() - self._db_ttl()
+        row = await LLMExtraction.objects.filter(key=key, created_at__gte=cutoff).afirst()
+        if row is None:
+            self._count('misses')
+            return None
+
+        await LLMExtraction.objects.filter(pk=row.pk).aupdate(hit_count=F('hit_count') + 1, last_hit_at=timezone.now())
+        self.memory.set(key, row.extracted)
+        self._count('db_hits')
+        return row.extracted
+
+    def set(self, key, extracted, model, prompt_version):
+        from api.models import LLMExtraction
+
+        LLMExtraction.objects.update_or_create(
+            key=key,
+            defaults={
+                'model': model,
+                'prompt_version': prompt_version,
+                'extracted': extracted,
+                'created_at': timezone.now(),
+            },
+        )
+        self.memory.set(key, extracted)
+        self._count('stores')
+
+    async def aset(self, key, extracted, model, prompt_version):
+        from api.models import LLMExtraction
+
+        await LLMExtraction.objects.aupdate_or_create(
+            key=key,
+            defaults={
+                'model': model,
+                'prompt_version': prompt_version,
+                'extracted': extracted,
+                'created_at': timezone.now(),
+            },
+        )
+        self.memory.set(key, extracted)
+        self._count('stores')
+
+    def stats(self):
+        from api.models import LLMExtraction
+
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['db_hits']
+        db = LLMExtraction.objects.aggregate(total_hits=Sum('hit_count'))
+        return {
+            **counters,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+            'memory_entries': len(self.memory),
+            'db_entries': LLMExtraction.objects.count(),
+            # Across all workers and restarts, not just this process
+            'db_total_hits': db['total_hits'] or 0,
+        }
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,151 @@
+"""
+Process-wide LLM clients.
+
+Building an OpenAI client per request threw away its HTTP connection pool,
+so every parse paid for a new TCP + TLS handshake. Clients are now created
+lazily, once per worker process, with a keep-alive pool sized from settings.
+
+gunicorn --preload forks workers after the app is imported; a pool created
+in the parent must not be shared with children (they'd interleave bytes on
+the same sockets), so clients are dropped in the child after a fork.
+"""
+
+import os
+import threading
+import weakref
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_pid = os.getpid()
+_sync_client = None
+_gemini_client = None
+# AsyncClient connections belong to the event loop that opened them, so keep
+# one async client per loop (uvicorn has one loop per worker).
+_async_clients = weakref.WeakKeyDictionary()
+_stats = {'clients_created': 0}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=_setting('LLM_HTTP_MAX_CONNECTIONS', 20),
+        max_keepalive_connections=_setting('LLM_HTTP_MAX_KEEPALIVE', 10),
+        keepalive_expiry=_setting('LLM_HTTP_KEEPALIVE_EXPIRY', 60),
+    )
+
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(_setting('LLM_TIMEOUT', 30), connect=_setting('LLM_CONNECT_TIMEOUT', 5))
+
+
+def _client_kwargs():
+    return {
+        'api_key': os.getenv("OPENAI_API_KEY"),
+        'timeout': _timeout(),
+        'max_retries': _setting('LLM_MAX_RETRIES', 2),
+    }
+
+
+def _reset_after_fork():
+    global _sync_client, _gemini_client, _async_clients, _pid, _lock
+    _lock = threading.Lock()
+    _pid = os.getpid()
+    _sync_client = None
+    _gemini_client = None
+    _async_clients = weakref.WeakKeyDictionary()
+    _stats['clients_created'] = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_openai_client():
+    """Shared OpenAI client for this process."""
+    global _sync_client
+    if os.getpid() != _pid:
+        # Platforms without os.register_at_fork
+        _reset_after_fork()
+    client = _sync_client
+    if client is None:
+        with _lock:
+            if _sync_client is None:
+                from openai import DefaultHttpxClient, OpenAI
+
+                _sync_client = OpenAI(
+                    http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+                    **_client_kwargs(),
+                )
+                _stats['clients_created'] += 1
+            client = _sync_client
+    return client
+
+
+def get_async_openai_client():
+    """Shared AsyncOpenAI client for the running event loop."""
+    import asyncio
+
+    if os.getpid() != _pid:
+        _reset_after_fork()
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        client = AsyncOpenAI(
+            http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+            **_client_kwargs(),
+        )
+        _async_clients[loop] = client
+        _stats['clients_created'] += 1
+    return client
+
+
+def gemini_api_key():
+    return os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+
+def get_gemini_client():
+    """
+    Shared google-genai client for this process.
+
+    The same client serves sync calls and, through client.aio, async ones.
+    """
+    global _gemini_client
+    if os.getpid() != _pid:
+        _reset_after_fork()
+    client = _gemini_client
+    if client is None:
+        with _lock:
+            if _gemini_client is None:
+                from google import genai
+                from google.genai import types
+
+                _gemini_client = genai.Client(
+                    api_key=gemini_api_key(),
+                    http_options=types.HttpOptions(timeout=int(_setting('LLM_TIMEOUT', 30) * 1000)),
+                )
+                _stats['clients_created'] += 1
+            client = _gemini_client
+    return client
+
+
+def reset_clients():
+    """Drop the cached clients, e.g. after OPENAI_API_KEY changes in tests."""
+    _reset_after_fork()
+
+
+def client_stats():
+    return {
+        'pid': _pid,
+        'clients_created': _stats['clients_created'],
+        'async_loops': len(_async_clients),
+    }
@@ -0,0 +1,68 @@
+"""
+Non-blocking structured logging.
+
+Request threads only put records on a bounded queue (QueueHandler); a
+background QueueListener formats them as one JSON object per line and does
+the actual write. When the queue is full records are dropped and counted
+rather than making a request wait on stdout.
+
+Wired up through LOGGING in core/settings.py.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """QueueHandler with its own listener thread writing JSON lines to stderr."""
+
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.target = logging.StreamHandler(sys.stderr)
+        self.target.setFormatter(JsonFormatter())
+        self.listener = None
+        self.start()
+        if hasattr(os, 'register_at_fork'):
+            # The listener thread doesn't survive a fork (gunicorn --preload)
+            os.register_at_fork(after_in_child=self.start)
+        atexit.register(self.stop)
+
+    def start(self):
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener and self.listener._thread:
+            self.listener.stop()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -0,0 +1,220 @@
+"""
+Micro-benchmarks for the lookup and parse hot paths.
+
+Usage:
+    python manage.py benchmark --sizes 100,10000,1000000 --output bench.json
+    python manage.py benchmark --baseline bench.json --threshold 0.2
+
+Each catalog size is seeded with synthetic foods inside a transaction that is
+rolled back afterwards, so the real catalog is left alone. The LLM is stubbed
+with canned tool calls. With --baseline the command exits non-zero when any
+benchmark's median is more than --threshold slower than in the baseline.
+"""
+
+import itertools
+import json
+import platform
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.catalog import get_catalog, refresh_catalog
+from api.llm_cache import extraction_cache
+from api.models import Food
+from api.units import normalize_unit, parse_quantity
+from api.utils import lookup_food_calories, parse_food_log
+
+SYLLABLES = ['ba', 'ko', 'la', 'mi', 'nu', 're', 'sa', 'to', 'fu', 'ye', 'da', 'gi', 'po', 'we', 'zu', 'ke']
+UNITS = ['cup', 'cups', '2 tbsp', 'plates', 'bowl', 'g', '250g', 'kilo', 'slice', 'wraps', 'oz', 'handful']
+QUANTITIES = ['2', 'two', '1/2', 'one and a half', 'a couple', '½', 'a dozen', '3.5']
+
+
+def food_names(count):
+    """count distinct made-up names of two to three pseudo-words."""
+    words = (''.join(p) for n in (2, 3) for p in itertools.product(SYLLABLES, repeat=n))
+    words = list(itertools.islice(words, 4096))
+    names = (f"{a} {b}" for a, b in itertools.product(words, repeat=2) if a != b)
+    return list(itertools.islice(names, count))
+
+
+def misspell(name, rng):
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def measure(fn, inputs, iterations):
+    """Per-call timings in microseconds after a short warm-up."""
+    for value in inputs[:5]:
+        fn(value)
+    samples = []
+    for i in range(iterations):
+        value = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        fn(value)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'median_us': round(statistics.median(samples), 2),
+        'p95_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        'mean_us': round(statistics.fmean(samples), 2),
+        'min_us': round(samples[0], 2),
+    }
+
+
+@contextmanager
+def stubbed_llm(stub):
+    """Send every extraction to stub(log_text), bypassing the extraction cache."""
+    with mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'benchmark'}), \
+            mock.patch('api.utils.request_extraction', side_effect=lambda text: (stub(text), 'benchmark:stub')), \
+            mock.patch.object(extraction_cache, 'get', return_value=None), \
+            mock.patch.object(extraction_cache, 'set'):
+        yield
+
+
+def time_once(fn):
+    start = time.perf_counter()
+    fn()
+    return {'iterations': 1, 'median_us': round((time.perf_counter() - start) * 1e6, 2)}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark catalog lookups, unit normalization and parse_food_log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000', help='Comma-separated catalog sizes to seed')
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Earlier --output file to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed slowdown of a median before it counts as a regression (0.2 = 20%%)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        iterations = options['iterations']
+        rng = random.Random(options['seed'])
+
+        results = {'units': self.bench_units(iterations)}
+        for size in sizes:
+            self.stdout.write(f"Seeding {size} foods...")
+            results[str(size)] = self.bench_catalog(size, iterations, rng)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': iterations,
+            },
+            'results': results,
+        }
+        self.print_results(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline['results'], results, options['threshold'])
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def bench_units(self, iterations):
+        texts = [f"{q} {u}" for q in QUANTITIES for u in UNITS]
+
+        def normalize(text):
+            quantity, _, unit = text.rpartition(' ')
+            return parse_quantity(quantity), normalize_unit(unit)
+
+        return {'normalize_quantity_and_unit': measure(normalize, texts, iterations)}
+
+    def bench_catalog(self, size, iterations, rng):
+        names = food_names(size)
+        if len(names) < size:
+            raise CommandError(f"Can only generate {len(names)} distinct names")
+        sample = rng.sample(names, min(len(names), 1000))
+        results = {}
+
+        with transaction.atomic():
+            Food.objects.bulk_create(
+                (Food(name=name, calories_per_100g=rng.randrange(20, 900), unit='g') for name in names),
+                batch_size=5000,
+            )
+            results['snapshot_build'] = time_once(refresh_catalog)
+            catalog = get_catalog()
+            results['fuzzy_index_build'] = time_once(lambda: catalog.fuzzy_index)
+            results['matcher_build'] = time_once(lambda: catalog.matcher)
+            results['suggest_index_build'] = time_once(lambda: catalog.suggest_index)
+
+            results['lookup_exact'] = measure(lambda n: lookup_food_calories(n, 2, 'cups'), sample, iterations)
+            misspelt = [misspell(n, rng) for n in sample]
+            results['lookup_fuzzy'] = measure(lambda n: lookup_food_calories(n, 1), misspelt, iterations)
+            missing = [f"qqx {n}" for n in sample]
+            results['lookup_miss'] = measure(lambda n: lookup_food_calories(n, 1), missing, iterations)
+            # What a user has typed so far: 1 to 6 letters of a name or of its second word
+            prefixes = [n.split(' ')[i % 2][:1 + i % 6] for i, n in enumerate(sample)]
+            results['suggest'] = measure(catalog.suggest_index.search, prefixes, iterations)
+            results['parse_food_log'] = self.bench_parse(sample, iterations)
+
+            transaction.set_rollback(True)
+        # Drop the snapshot of the rolled-back foods
+        refresh_catalog()
+        return results
+
+    def bench_parse(self, sample, iterations):
+        """Full parse of a mixed log: two local segments plus one for the (stubbed) LLM."""
+        logs = []
+        for i in range(0, len(sample) - 2, 3):
+            a, b, c = sample[i:i + 3]
+            logs.append((f"2 cups {a}, a plate of {b} and some {c} mixed with stuff", c))
+        current = {}
+
+        def stub(log_text):
+            return [{"food_name": current['llm_food'], "quantity": 1, "unit": "bowl"}]
+
+        def run(log):
+            text, current['llm_food'] = log
+            return parse_food_log(text)
+
+        with stubbed_llm(stub):
+            # Make sure both paths are exercised before timing anything
+            sources = sorted(item['source'] for item in run(logs[0])[0])
+            if sources != ['llm', 'local', 'local']:
+                raise CommandError(f"Unexpected parse of the benchmark log: {sources}")
+            return measure(run, logs, iterations)
+
+    def print_results(self, results):
+        for group, benches in results.items():
+            self.stdout.write(f"\n[{group}]")
+            for name, r in benches.items():
+                extra = f"  p95 {r['p95_us']:>10.1f} us" if 'p95_us' in r else ''
+                self.stdout.write(f"  {name:<28} median {r['median_us']:>12.1f} us{extra}")
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        self.stdout.write(f"\nCompared with baseline (threshold {threshold:.0%}):")
+        for group, benches in results.items():
+            for name, r in benches.items():
+                old = baseline.get(group, {}).get(name)
+                if not old or not old.get('median_us'):
+                    continue
+                change = r['median_us'] / old['median_us'] - 1
+                regressed = change > threshold
+                line = f"  {group}/{name:<28} {change:+.1%}"
+                self.stdout.write(self.style.ERROR(line) if regressed else line)
+                if regressed:
+                    regressions.append(f"{group}/{name}")
+        return regressions
@@ -0,0 +1,57 @@
+"""
+Write the Food table to the memory-mapped index read by api.catalog_index.
+
+Usage:
+    python manage.py build_catalog_index            # to FOOD_CATALOG_INDEX_PATH
+    python manage.py build_catalog_index --output /srv/catalog.idx --force
+
+Run it after anything that changes the catalog (populate_foods,
+import_foods, admin edits). The new file replaces the old one atomically and
+every worker switches to it within a second. The file records the catalog
+content hash, so rebuilding an unchanged catalog is skipped unless --force.
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog import NUTRIENT_FIELDS
+from api.catalog_index import read_header, write_index
+from api.models import Food, FoodPortion
+from api.versioning import current_version
+
+
+class Command(BaseCommand):
+    help = 'Build the memory-mapped food catalog index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Default: FOOD_CATALOG_INDEX_PATH')
+        parser.add_argument('--force', action='store_true', help='Rebuild even if the catalog is unchanged')
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'FOOD_CATALOG_INDEX_PATH', '')
+        if not path:
+            raise CommandError("Pass --output or set FOOD_CATALOG_INDEX_PATH")
+
+        # Hashed before reading, so a write during the build makes the next
+        # run rebuild instead of skipping
+        _, content_hash = current_version()
+        header = read_header(path)
+        if header is not None and header[2] == content_hash and not options['force']:
+            self.stdout.write(f"{path} is up to date ({header[0]} foods), skipping (use --force to rebuild)")
+            return
+
+        start = time.perf_counter()
+        foods = Food.objects.order_by().values_list('id', 'name', 'unit', *NUTRIENT_FIELDS)
+        portions = FoodPortion.objects.order_by().values_list('food_id', 'unit', 'grams')
+        try:
+            count = write_index(path, foods.iterator(chunk_size=10000), portions.iterator(), content_hash)
+        except OSError as e:
+            raise CommandError(f"Cannot write {path}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {count} foods to {path} ({os.path.getsize(path) / 1024:,.0f} KiB) "
+            f"in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,196 @@
+"""
+Bulk-load a food-composition table into the catalog.
+
+Usage:
+    python manage.py import_foods foods.csv
+    python manage.py import_foods foods.jsonl.gz --chunk-size 10000
+    python manage.py import_foods fdc.csv --name-field description --calories-field energy_kcal
+
+The file is read as a stream and written in chunks, each one upsert
+(INSERT ... ON CONFLICT (name) DO UPDATE) in its own transaction, so memory
+stays flat however big the file is and an interrupted import keeps the
+chunks it already finished. Rows that fail validation are counted and
+skipped; the first few are printed with their line numbers.
+
+Optional macro columns (grams per 100 g) are read from protein_per_100g,
+carbs_per_100g, fat_per_100g and fiber_per_100g, or just protein, carbs,
+fat and fiber. Empty ones are stored as unknown (null), not 0. Columns the
+input doesn't have are left alone on existing foods, so a calories-only file
+doesn't wipe macros loaded from another source.
+"""
+
+import csv
+import gzip
+import itertools
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.catalog import MACRO_FIELDS, invalidate_catalog
+from api.models import Food
+
+NAME_MAX_LENGTH = Food._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Food._meta.get_field('unit').max_length
+# Pure fat is about 900 kcal/100g; anything above that is a bad row (or kJ)
+MAX_CALORIES_PER_100G = 1000
+ERRORS_SHOWN = 10
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(f, fmt):
+    """Yield (line_number, dict) pairs without reading the whole file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f"invalid JSON: {e}")
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError("not a JSON object")
+
+
+def clean_macros(row):
+    """{field: grams per 100 g} for the macro columns the row has. Raises ValueError."""
+    macros = {}
+    for field in MACRO_FIELDS:
+        key = field if field in row else field.removesuffix('_per_100g')
+        if key not in row:
+            continue
+        raw = row[key]
+        if raw in (None, ''):
+            macros[field] = None
+            continue
+        try:
+            value = float(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} is not a number: {raw!r}")
+        if not 0 <= value <= 100:
+            raise ValueError(f"{field} out of range: {value}")
+        macros[field] = value
+    return macros
+
+
+def clean_row(row, name_field, calories_field, default_unit):
+    """Validated (name, calories_per_100g, unit, macros) for one input row. Raises ValueError."""
+    if isinstance(row, Exception):
+        raise row
+    name = ' '.join(str(row.get(name_field) or '').lower().split())
+    if not name:
+        raise ValueError(f"missing {name_field}")
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f"name longer than {NAME_MAX_LENGTH} characters")
+
+    raw = row.get(calories_field)
+    try:
+        calories = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{calories_field} is not a number: {raw!r}")
+    if not 0 <= calories <= MAX_CALORIES_PER_100G:
+        raise ValueError(f"{calories_field} out of range: {calories}")
+
+    unit = str(row.get('unit') or default_unit).strip().lower()
+    if len(unit) > UNIT_MAX_LENGTH:
+        raise ValueError(f"unit longer than {UNIT_MAX_LENGTH} characters")
+    return name, round(calories), unit, clean_macros(row)
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV/JSONL food table into the catalog with batched upserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, optionally .gz; '-' reads stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: guessed from the file name')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--name-field', default='name')
+        parser.add_argument('--calories-field', default='calories_per_100g')
+        parser.add_argument('--unit', default='g', help="Unit for rows without a 'unit' field")
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, write nothing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if '.jsonl' in path or '.ndjson' in path else 'csv')
+        chunk_size = max(1, options['chunk_size'])
+        dry_run = options['dry_run']
+
+        try:
+            f = open_input(path)
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        counts = {'read': 0, 'imported': 0, 'invalid': 0}
+        start = time.perf_counter()
+        with f:
+            rows = read_rows(f, fmt)
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                foods = self.validate(chunk, options, counts)
+                if foods and not dry_run:
+                    self.upsert(foods)
+                counts['imported'] += len(foods)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"  {counts['read']:>10} rows read, {counts['read'] / elapsed:,.0f} rows/s")
+
+        if counts['imported'] and not dry_run:
+            # bulk_create() sends no post_save, so tell the catalog ourselves
+            invalidate_catalog()
+
+        elapsed = time.perf_counter() - start
+        verb = 'Validated' if dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['imported']} foods from {counts['read']} rows "
+            f"({counts['invalid']} invalid) in {elapsed:.1f}s, {counts['read'] / max(elapsed, 1e-9):,.0f} rows/s"
+        ))
+
+    def validate(self, chunk, options, counts):
+        """
+        (Food, macro fields it has) for the valid rows of a chunk, one per
+        name (the last one wins).
+        """
+        foods = {}
+        for line_number, row in chunk:
+            counts['read'] += 1
+            try:
+                name, calories, unit, macros = clean_row(
+                    row, options['name_field'], options['calories_field'], options['unit']
+                )
+            except ValueError as e:
+                counts['invalid'] += 1
+                if counts['invalid'] <= ERRORS_SHOWN:
+                    self.stderr.write(f"  line {line_number}: {e}")
+                continue
+            # Postgres refuses to update the same row twice in one INSERT ... ON CONFLICT
+            foods[name] = (Food(name=name, calories_per_100g=calories, unit=unit, **macros), tuple(macros))
+        return list(foods.values())
+
+    def upsert(self, foods):
+        # Rows only overwrite the macro columns they have; a file's rows
+        # normally all have the same ones, so this is one statement per chunk
+        groups = {}
+        for food, macro_fields in foods:
+            groups.setdefault(macro_fields, []).append(food)
+        with transaction.atomic():
+            for macro_fields, group in groups.items():
+                Food.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=['name'],
+                    update_fields=['calories_per_100g', 'unit', *macro_fields],
+                )
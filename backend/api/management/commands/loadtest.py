@@ -0,0 +1,336 @@
+"""
+End-to-end load test of /parse-log against a local OpenAI-compatible stub.
+
+Usage:
+    python manage.py loadtest --server wsgi --concurrency 50 --duration 30
+    python manage.py loadtest --server both --llm-latency lognormal:0.8:0.5
+    python manage.py loadtest --url http://127.0.0.1:8000 --stub-port 9100
+
+The command starts an HTTP stub that answers /v1/chat/completions with canned
+tool calls after a delay drawn from --llm-latency, starts the app under
+gunicorn (sync WSGI workers, or uvicorn workers with ASYNC_PARSE_LOG=1) with
+OPENAI_BASE_URL pointing at the stub, mints JWTs for synthetic users and
+keeps --concurrency requests in flight. Every log is unique so the
+extraction cache doesn't hide the LLM round trip.
+
+With --url an already running server is used instead; it has to be started
+with OPENAI_BASE_URL=<printed stub url> itself.
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Food
+
+SERVER_COMMANDS = {
+    'wsgi': ['core.wsgi:application', '--workers', '{workers}', '--threads', '{threads}'],
+    'asgi': ['core.asgi:application', '-k', 'uvicorn.workers.UvicornWorker', '--workers', '{workers}'],
+}
+
+
+def latency_sampler(spec):
+    """
+    Parse a latency distribution; returns a function giving seconds.
+
+    fixed:S, uniform:LOW:HIGH, normal:MEAN:SD, lognormal:MEDIAN:SIGMA, exp:MEAN
+    """
+    kind, _, params = spec.partition(':')
+    try:
+        args = [float(p) for p in params.split(':') if p]
+        samplers = {
+            'fixed': lambda: args[0],
+            'uniform': lambda: random.uniform(args[0], args[1]),
+            'normal': lambda: random.gauss(args[0], args[1]),
+            'lognormal': lambda: args[0] * random.lognormvariate(0, args[1]),
+            'exp': lambda: random.expovariate(1 / args[0]),
+        }
+        sampler = samplers[kind]
+        sampler()
+    except (KeyError, IndexError, ValueError, ZeroDivisionError):
+        raise CommandError(f"Bad latency spec {spec!r}; try fixed:0.5, uniform:0.2:1, lognormal:0.8:0.5 or exp:1")
+    return lambda: max(0.0, sampler())
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LLMStub:
+    """Threaded HTTP server that speaks just enough of the chat completions API."""
+
+    def __init__(self, tool_calls, latency='fixed:0.5', error_rate=0.0, port=0):
+        self.tool_calls = tool_calls
+        self.latency = latency_sampler(latency)
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def completion(self, request):
+        return {
+            "id": f"chatcmpl-stub-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "tool_calls",
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "id": f"call_{i}",
+                            "type": "function",
+                            "function": {"name": "lookup_food_calories", "arguments": json.dumps(args)},
+                        }
+                        for i, args in enumerate(self.tool_calls)
+                    ],
+                },
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with stub._lock:
+                    stub.calls += 1
+                    failed = random.random() < stub.error_rate
+                    stub.errors += failed
+                time.sleep(stub.latency())
+                if failed:
+                    self.reply(500, {"error": {"message": "stub failure", "type": "server_error"}})
+                else:
+                    self.reply(200, stub.completion(request))
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class Command(BaseCommand):
+    help = 'Load test /parse-log under WSGI and/or ASGI against a local LLM stub'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi', 'both'], default='wsgi')
+        parser.add_argument('--url', help='Drive an already running server instead of starting one')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=20, help='Seconds per run')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per sync (WSGI) worker')
+        parser.add_argument('--users', type=int, default=10, help='Synthetic users to spread requests over')
+        parser.add_argument('--llm-latency', default='lognormal:0.8:0.4',
+                            help='fixed:S | uniform:LOW:HIGH | normal:MEAN:SD | lognormal:MEDIAN:SIGMA | exp:MEAN')
+        parser.add_argument('--llm-error-rate', type=float, default=0.0)
+        parser.add_argument('--payload', help='JSON file with a list of tool-call argument dicts to return')
+        parser.add_argument('--stub-port', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--server-log', help='Append the started server\'s output to this file')
+        parser.add_argument('--keep-users', action='store_true')
+
+    def handle(self, *args, **options):
+        stub = LLMStub(
+            self.tool_calls(options['payload']),
+            latency=options['llm_latency'],
+            error_rate=options['llm_error_rate'],
+            port=options['stub_port'],
+        ).start()
+        self.stdout.write(f"LLM stub listening on {stub.base_url}")
+
+        users = self.make_users(options['users'])
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        results = {}
+        try:
+            if options['url']:
+                results['external'] = self.run(options['url'], tokens, stub, options)
+            else:
+                modes = ['wsgi', 'asgi'] if options['server'] == 'both' else [options['server']]
+                for mode in modes:
+                    results[mode] = self.run_with_server(mode, tokens, stub, options)
+        finally:
+            stub.stop()
+            if not options['keep_users']:
+                User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in (
+                    'concurrency', 'duration', 'workers', 'threads', 'llm_latency', 'llm_error_rate'
+                )}, 'results': results}, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def tool_calls(self, payload):
+        if payload:
+            with open(payload) as f:
+                return json.load(f)
+        names = list(Food.objects.values_list('name', flat=True)[:3])
+        if not names:
+            raise CommandError('The Food table is empty; run populate_foods first or pass --payload')
+        return [{"food_name": name, "quantity": 1, "unit": "cup"} for name in names]
+
+    def make_users(self, count):
+        users = []
+        for i in range(count):
+            user, created = User.objects.get_or_create(username=f'loadtest-{i}')
+            if created:
+                user.set_unusable_password()
+                user.save()
+            users.append(user)
+        return users
+
+    def run_with_server(self, mode, tokens, stub, options):
+        port = free_port()
+        command = [sys.executable, '-m', 'gunicorn'] + [
+            part.format(workers=options['workers'], threads=options['threads']) for part in SERVER_COMMANDS[mode]
+        ] + ['--bind', f'127.0.0.1:{port}', '--timeout', '120']
+        env = dict(
+            os.environ,
+            OPENAI_BASE_URL=stub.base_url,
+            OPENAI_API_KEY='loadtest',
+            LLM_PROVIDERS='openai',
+            ASYNC_PARSE_LOG='1' if mode == 'asgi' else '',
+        )
+        self.stdout.write(f"Starting {mode}: {' '.join(command[1:])}")
+        log = open(options['server_log'], 'a') if options['server_log'] else subprocess.DEVNULL
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            url = f'http://127.0.0.1:{port}'
+            self.wait_until_up(url, server)
+            return self.run(url, tokens, stub, options)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            if log is not subprocess.DEVNULL:
+                log.close()
+
+    def wait_until_up(self, url, server, timeout=30):
+        import httpx
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with code {server.returncode} (is gunicorn/uvicorn installed?)")
+            try:
+                httpx.get(f'{url}/metrics', timeout=1)
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+        raise CommandError(f"Server at {url} didn't come up within {timeout}s")
+
+    def run(self, url, tokens, stub, options):
+        calls_before = stub.calls
+        result = asyncio.run(drive(f'{url}/parse-log', tokens, options['concurrency'], options['duration']))
+        result['llm_calls'] = stub.calls - calls_before
+        return result
+
+    def print_results(self, results):
+        columns = ['requests', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'llm_calls']
+        self.stdout.write('\n' + f"{'':<10}" + ''.join(f"{c:>16}" for c in columns))
+        for name, result in results.items():
+            self.stdout.write(f"{name:<10}" + ''.join(f"{str(result.get(c)):>16}" for c in columns))
+
+
+async def drive(url, tokens, concurrency, duration):
+    """Keep `concurrency` requests in flight for `duration` seconds."""
+    import httpx
+
+    latencies = []
+    statuses = {}
+    error_samples = []
+    counter = iter(range(10 ** 9))
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        start = time.monotonic()
+        stop_at = start + duration
+
+        async def user_loop(worker):
+            while time.monotonic() < stop_at:
+                i = next(counter)
+                # Nothing here is in the catalog, so every request reaches the LLM,
+                # and the run id + request number keep the extraction cache out of it
+                body = {'foodLog': f"lunch at the canteen, order {run_id}-{i}"}
+                headers = {'Authorization': f'Bearer {tokens[i % len(tokens)]}'}
+                sent = time.monotonic()
+                try:
+                    response = await client.post(url, json=body, headers=headers)
+                    status = response.status_code
+                    if status != 200 and len(error_samples) < 5:
+                        error_samples.append(response.text[:300])
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.monotonic() - sent)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(user_loop(w) for w in range(concurrency)))
+        elapsed = time.monotonic() - start
+
+    latencies.sort()
+    ms = lambda s: round(s * 1000, 1) if s is not None else None  # noqa: E731
+    return {
+        'requests': len(latencies),
+        'errors': sum(n for status, n in statuses.items() if status != 200),
+        'statuses': {str(k): v for k, v in statuses.items()},
+        'error_samples': error_samples,
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else None,
+    }
@@ -0,0 +1,57 @@
+"""
+Rank the foods (and units) users logged that the catalog couldn't resolve.
+
+Usage:
+    python manage.py missing_foods --limit 30
+    python manage.py missing_foods --kind unit --days 7
+    python manage.py missing_foods --clear   # after adding them to the catalog
+
+Counts come from the MissingFood table, which each worker updates in the
+background (see api.misses), so the last MISS_FLUSH_INTERVAL seconds of
+misses may not be in yet.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.catalog import get_catalog
+from api.models import MissingFood
+
+
+class Command(BaseCommand):
+    help = 'List unresolved food names and units by how often they were logged'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['food', 'unit', 'all'], default='food')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--days', type=int, help='Only names seen in the last N days')
+        parser.add_argument('--clear', action='store_true', help='Delete the listed kind instead of reporting it')
+
+    def handle(self, *args, **options):
+        misses = MissingFood.objects.all()
+        if options['kind'] != 'all':
+            misses = misses.filter(kind=options['kind'])
+        if options['days']:
+            misses = misses.filter(last_seen__gte=timezone.now() - timedelta(days=options['days']))
+
+        if options['clear']:
+            deleted, _ = misses.delete()
+            self.stdout.write(f"Deleted {deleted} row(s)")
+            return
+
+        rows = list(misses.order_by('-count', 'name')[:options['limit']])
+        if not rows:
+            self.stdout.write("No misses recorded")
+            return
+
+        catalog = get_catalog()
+        self.stdout.write(f"{'#':>3}  {'count':>7}  {'kind':<5} {'name':<40} last seen")
+        for rank, miss in enumerate(rows, 1):
+            # Foods added since the miss was recorded are flagged rather than hidden
+            added = miss.kind == MissingFood.FOOD and catalog.get(miss.name) is not None
+            name = f"{miss.name} (now in catalog)" if added else miss.name
+            self.stdout.write(
+                f"{rank:>3}  {miss.count:>7}  {miss.kind:<5} {name:<40} {miss.last_seen:%Y-%m-%d %H:%M}"
+            )
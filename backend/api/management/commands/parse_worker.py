@@ -0,0 +1,90 @@
+"""
+Drain the ParseJob queue filled by POST /parse-log?async=1.
+
+Usage:
+    python manage.py parse_worker --processes 4
+    python manage.py parse_worker --once   # process what's queued, then exit
+
+Each process claims one job at a time; run more processes (or more copies of
+the command on other machines) to parse more logs in parallel.
+"""
+
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import claim_job, delete_old_jobs, requeue_stale_jobs, run_job, worker_name
+
+MAINTENANCE_INTERVAL = 30
+
+
+def work(stop, poll_interval, once):
+    """Worker loop; returns the number of jobs processed."""
+    name = worker_name()
+    processed = 0
+    next_maintenance = 0
+    while not stop.is_set():
+        if time.monotonic() >= next_maintenance:
+            requeue_stale_jobs()
+            delete_old_jobs()
+            next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+
+        job = claim_job(name)
+        if job is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    connections.close_all()
+    return processed
+
+
+def _child(stop, poll_interval, once):
+    # Ctrl-C goes to the whole process group; let the parent coordinate shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop, poll_interval, once)
+
+
+class Command(BaseCommand):
+    help = 'Process queued /parse-log?async=1 jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=0.5, help='Seconds between polls when idle')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        poll_interval = options['poll_interval']
+        once = options['once']
+
+        if processes == 1:
+            processed = work(multiprocessing.Event(), poll_interval, once)
+            self.stdout.write(f"Processed {processed} job(s)")
+            return
+
+        # Children must not inherit the parent's open DB connections
+        connections.close_all()
+        stop = multiprocessing.Event()
+        children = [
+            multiprocessing.Process(target=_child, args=(stop, poll_interval, once), daemon=True)
+            for _ in range(processes)
+        ]
+        for child in children:
+            child.start()
+        self.stdout.write(f"Started {processes} parse workers")
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write("Stopping after the current jobs...")
+            for child in children:
+                child.join()
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
-from api.models import Food
+from django.db import transaction
+from api.models import Food, FoodPortion
+from api.versioning import record_source, source_is_current
 
 CALORIE_DATABASE = {
     # Swallows & Staples
@@ -124,27 +126,73 @@ CALORIE_DATABASE = {
     'mango': {'calories_per_100g': 60, 'unit': 'g'},
 }
 
+# Typical weights (g) of food-specific units, e.g. "2 slices of bread"
+PORTION_DATABASE = {
+    'white bread': {'slice': 30},
+    'whole wheat bread': {'slice': 33},
+    'banana bread': {'slice': 60},
+    'akara': {'ball': 25, 'piece': 25},
+    'puff puff': {'ball': 35, 'piece': 35},
+    'moi moi': {'wrap': 150, 'piece': 150},
+    'meat pie': {'piece': 150},
+    'egg roll': {'piece': 110},
+    'samosa': {'piece': 50},
+    'gala': {'piece': 70},
+    'kuli kuli': {'piece': 10},
+    'suya': {'stick': 50},
+    'chicken': {'piece': 120},
+    'chicken breast': {'piece': 170},
+    'chicken drumstick': {'piece': 100},
+    'chicken thigh': {'piece': 110},
+    'chicken wings': {'piece': 35},
+    'beef': {'piece': 40},
+    'goat meat': {'piece': 40},
+    'fish': {'piece': 100},
+    'snail': {'piece': 30},
+    'sardines': {'piece': 25},
+    'banana': {'piece': 120},
+    'orange': {'piece': 130},
+    'mango': {'piece': 200},
+}
+
 class Command(BaseCommand):
     help = "Load 101+ Nigerian foods into database"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Write the foods even if nothing changed')
+
     def handle(self, *args, **kwargs):
+        source = {"foods": CALORIE_DATABASE, "portions": PORTION_DATABASE}
+        # Runs on every deploy; skip the writes (and the version bump) if
+        # this data is already what's in the catalog
+        if not kwargs['force'] and source_is_current('populate_foods', source):
+            self.stdout.write("Catalog already up to date, nothing to do.")
+            return
+
         self.stdout.write("Starting food database population/update...")
         
         created_count = 0
         updated_count = 0
         
-        for name, data in CALORIE_DATABASE.items():
-            food, created = Food.objects.update_or_create(
-                name=name,
-                defaults={
-                    "calories_per_100g": data["calories_per_100g"], 
-                    "unit": data["unit"]
-                }
-            )
-            if created:
-                created_count += 1
-            else:
-                updated_count += 1
+        # One transaction so the catalog snapshot is refreshed once, not per food
+        with transaction.atomic():
+            for name, data in CALORIE_DATABASE.items():
+                food, created = Food.objects.update_or_create(
+                    name=name,
+                    defaults={
+                        "calories_per_100g": data["calories_per_100g"], 
+                        "unit": data["unit"]
+                    }
+                )
+                if created:
+                    created_count += 1
+                else:
+                    updated_count += 1
+
+                for unit, grams in PORTION_DATABASE.get(name, {}).items():
+                    FoodPortion.objects.update_or_create(food=food, unit=unit, defaults={"grams": grams})
+
+        record_source('populate_foods', source)
                 
         self.stdout.write(
             self.style.SUCCESS(
@@ -4,13 +4,18 @@ Usage: python manage.py update_food_database
 """
 
 from django.core.management.base import BaseCommand
+from api.catalog import invalidate_catalog
 from api.models import Food
+from api.versioning import record_source, source_is_current
 import json
 import os
 
 class Command(BaseCommand):
     help = 'Update food database with extracted Nigerian food data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Compare every food even if the file is unchanged')
+
     def handle(self, *args, **options):
         # Load extracted food data
         json_path = '/app/extracted_foods.json'
@@ -22,6 +27,10 @@ class Command(BaseCommand):
         with open(json_path, 'r') as f:
             new_foods = json.load(f)
         
+        if not options['force'] and source_is_current('update_food_database', new_foods):
+            self.stdout.write("extracted_foods.json already applied and catalog unchanged, nothing to do.")
+            return
+        
         # Get current database state
         existing_foods = {food.name.lower(): food for food in Food.objects.all()}
         
@@ -74,6 +83,9 @@ class Command(BaseCommand):
         # Bulk create new foods
         if foods_to_create:
             Food.objects.bulk_create(foods_to_create)
+            # bulk_create() doesn't send post_save, so refresh the catalog ourselves
+            invalidate_catalog()
+        record_source('update_food_database', new_foods)
         
         # Final report
         new_total = Food.objects.count()
@@ -0,0 +1,83 @@
+"""
+Aho-Corasick automaton for finding every catalog food name in a piece of text.
+
+One pass over the text finds all occurrences of all names, so the cost no
+longer grows with catalog size the way the old "try each name, longest
+first" loop did.
+"""
+
+from collections import deque
+
+
+class FoodMatcher:
+    def __init__(self, names):
+        # Node 0 is the root. Each node has goto edges, a failure link and the
+        # lengths of the patterns that end at it.
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for name in names:
+            self._add(name)
+        self._build_failure_links()
+
+    def _add(self, name):
+        node = 0
+        for char in name:
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+                self.goto[node][char] = nxt
+            node = nxt
+        self.output[node] = self.output[node] + (len(name),)
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                # Inherit matches that end here via the failure chain
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find_all(self, text):
+        """Yield (start, end) for every pattern occurrence in `text`."""
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for length in self.output[node]:
+                yield index + 1 - length, index + 1
+
+    def find(self, text):
+        """
+        Return non-overlapping whole-word matches as (start, end, name).
+
+        Overlaps are resolved leftmost-longest, so "jollof rice" wins over
+        "rice" and "egusi soup" wins over "egusi".
+        """
+        candidates = []
+        for start, end in self.find_all(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if end < len(text) and text[end].isalnum():
+                continue
+            candidates.append((start, end))
+
+        candidates.sort(key=lambda span: (span[0], -(span[1] - span[0])))
+        matches = []
+        last_end = -1
+        for start, end in candidates:
+            if start >= last_end:
+                matches.append((start, end, text[start:end]))
+                last_end = end
+        return matches
@@ -0,0 +1,202 @@
+"""
+In-process metrics for the parse pipeline, served at /metrics in the
+Prometheus text format.
+
+Values are per worker process, like the /stats counters; scrape every worker
+(or run one per container) and let Prometheus sum them.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, '') for n in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # key -> [per-bucket counts, sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(n, '') for n in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    'parse_stage_seconds', 'Time spent in each parse stage (llm, lookup, ...).', ['stage'],
+))
+llm_tool_calls = registry.register(Histogram(
+    'parse_llm_tool_calls', 'Tool calls returned by one LLM extraction.', buckets=COUNT_BUCKETS,
+))
+unresolved_foods = registry.register(Histogram(
+    'parse_unresolved_foods', 'Extracted foods per parsed log that matched nothing in the catalog.',
+    buckets=COUNT_BUCKETS,
+))
+parsed_items = registry.register(Counter(
+    'parse_items_total', 'Parsed food items by the path that resolved them.', ['source'],
+))
+request_seconds = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by view.', ['view'],
+))
+request_queries = registry.register(Histogram(
+    'http_request_db_queries', 'Database queries per request by view.', ['view'], buckets=COUNT_BUCKETS,
+))
+
+
+def observe_parse(extracted, items):
+    """Record one parsed log: items per source and how many foods went unresolved."""
+    for item in items:
+        parsed_items.inc(source=item.get("source", ""))
+    unresolved_foods.observe(len(extracted) - len(items))
+
+
+# --- Database queries per request ---
+
+_query_count = contextvars.ContextVar('db_query_count', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver: count every query run on the connection."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class MetricsMiddleware:
+    """Observes latency and DB query count of every request, labelled by URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, start = self._start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, token, start)
+
+    async def __acall__(self, request):
+        token, start = self._start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, token, start)
+
+    def _start(self):
+        # A list, so sync_to_async threads running in a copy of this context
+        # still add to the same counter
+        return _query_count.set([0]), time.perf_counter()
+
+    def _finish(self, request, token, start):
+        counter = _query_count.get()
+        _query_count.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        request_seconds.observe(time.perf_counter() - start, view=view)
+        request_queries.observe(counter[0], view=view)
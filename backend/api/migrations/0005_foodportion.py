@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 18:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_llmextraction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodPortion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(max_length=20)),
+                ('grams', models.FloatField()),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='portions', to='api.food')),
+            ],
+            options={
+                'unique_together': {('food', 'unit')},
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0 on 2026-10-18 18:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_foodportion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('logged_on', models.DateField()),
+                ('total_calories', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='food_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FoodLogItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('quantity', models.CharField(max_length=50)),
+                ('grams', models.FloatField()),
+                ('calories', models.FloatField()),
+                ('source', models.CharField(max_length=10)),
+                ('food', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='log_items', to='api.food')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.foodlog')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_calories', models.FloatField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+                ('log_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='foodlog',
+            index=models.Index(fields=['user', 'logged_on'], name='api_foodlog_user_id_c70445_idx'),
+        ),
+    ]
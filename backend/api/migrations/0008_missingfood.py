@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_parsejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MissingFood',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('food', 'Food'), ('unit', 'Unit')], max_length=10)),
+                ('name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-count'],
+                'unique_together': {('kind', 'name')},
+            },
+        ),
+    ]
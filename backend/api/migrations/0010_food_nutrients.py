@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='carbs_per_100g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='fat_per_100g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='fiber_per_100g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='protein_per_100g',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+MACRO_FIELDS = ('protein_per_100g', 'carbs_per_100g', 'fat_per_100g', 'fiber_per_100g')
+
+
+def zeros_to_unknown(apps, schema_editor):
+    # 0010 filled every existing food with 0 for "no data". A food with all
+    # four macros at 0 came from a source without them, so mark it unknown.
+    Food = apps.get_model('api', 'Food')
+    Food.objects.filter(**{field: 0 for field in MACRO_FIELDS}).update(**{field: None for field in MACRO_FIELDS})
+
+
+def unknown_to_zeros(apps, schema_editor):
+    Food = apps.get_model('api', 'Food')
+    for field in MACRO_FIELDS:
+        Food.objects.filter(**{f'{field}__isnull': True}).update(**{field: 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_food_nutrients'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='food',
+            name='carbs_per_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='fat_per_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='fiber_per_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='food',
+            name='protein_per_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(zeros_to_unknown, unknown_to_zeros),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_logged_items(apps, schema_editor):
+    Food = apps.get_model('api', 'Food')
+    FoodLogItem = apps.get_model('api', 'FoodLogItem')
+    counts = (
+        FoodLogItem.objects.order_by().filter(food__isnull=False)
+        .values_list('food_id').annotate(n=Count('id')).values_list('food_id', 'n')
+    )
+    for food_id, n in counts.iterator():
+        Food.objects.filter(pk=food_id).update(times_logged=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_food_macros_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='times_logged',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_logged_items, migrations.RunPython.noop),
+    ]
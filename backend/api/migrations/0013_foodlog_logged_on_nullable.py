@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_food_times_logged'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='foodlog',
+            name='logged_on',
+            field=models.DateField(null=True),
+        ),
+    ]
@@ -0,0 +1,122 @@
+"""
+Write-behind counters for foods and units that matched nothing.
+
+Recording a miss is a dict increment under a lock, so the parse path never
+waits on the database. A background thread swaps the pending Counter out
+every MISS_FLUSH_INTERVAL seconds (or once MISS_FLUSH_MAX_KEYS names are
+pending) and adds it to the MissingFood table with one upsert per batch:
+
+    INSERT ... ON CONFLICT (kind, name) DO UPDATE SET count = count + excluded.count
+
+Misses still pending when a worker exits are lost; the numbers are for
+deciding what to add to the catalog, not accounting.
+"""
+
+import logging
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class MissRecorder:
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.counters = {'recorded': 0, 'flushed_rows': 0, 'flushes': 0, 'flush_errors': 0}
+
+    def record(self, kind, name):
+        interval = _setting('MISS_FLUSH_INTERVAL', 30)
+        name = ' '.join((name or '').lower().split())[:100]
+        if not name or interval <= 0:
+            return
+        with self._lock:
+            self._pending[(kind, name)] += 1
+            self.counters['recorded'] += 1
+            full = len(self._pending) >= _setting('MISS_FLUSH_MAX_KEYS', 1000)
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def record_food(self, name):
+        self.record('food', name)
+
+    def record_unit(self, unit):
+        self.record('unit', unit)
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write the pending counts in one batch; returns the number of rows upserted."""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return 0
+
+        from api.models import MissingFood
+
+        now = timezone.now()
+        table = connection.ops.quote_name(MissingFood._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} (kind, name, count, first_seen, last_seen) VALUES (%s, %s, %s, %s, %s) "
+            f"ON CONFLICT (kind, name) DO UPDATE SET count = {table}.count + excluded.count, "
+            f"last_seen = excluded.last_seen"
+        )
+        rows = [(kind, name, count, now, now) for (kind, name), count in batch.items()]
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        except DatabaseError:
+            # Put them back and try again next time
+            with self._lock:
+                self._pending.update(batch)
+                self.counters['flush_errors'] += 1
+            raise
+        with self._lock:
+            self.counters['flushes'] += 1
+            self.counters['flushed_rows'] += len(rows)
+        return len(rows)
+
+    def _ensure_thread(self):
+        # One flusher per process; a forked gunicorn worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='miss-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(_setting('MISS_FLUSH_INTERVAL', 30))
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Could not flush missing food counts", extra={"error": str(e)})
+            finally:
+                # Don't keep a connection open between flushes
+                connection.close()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'pending': len(self._pending)}
+
+
+missing_foods = MissRecorder()
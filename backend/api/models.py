@@ -1,12 +1,177 @@
+from django.conf import settings
 from django.db import models
 
 class Food(models.Model):
     name = models.CharField(max_length=100, unique=True, db_index=True)
     calories_per_100g = models.IntegerField()
     unit = models.CharField(max_length=20)  
+    # Grams per 100 g; null where the source had no macro data (not 0, which
+    # would be reported and summed as a real value)
+    protein_per_100g = models.FloatField(null=True, blank=True)
+    carbs_per_100g = models.FloatField(null=True, blank=True)
+    fat_per_100g = models.FloatField(null=True, blank=True)
+    fiber_per_100g = models.FloatField(null=True, blank=True)
+    # How many logged items matched this food, for ranking suggestions. Kept
+    # by record_food_log() so catalog rebuilds don't aggregate every item.
+    times_logged = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['name']
 
     def __str__(self):
-        return f"{self.name} ({self.calories_per_100g} cal/100g)"
\ No newline at end of file
+        return f"{self.name} ({self.calories_per_100g} cal/100g)"
+
+
+class FoodPortion(models.Model):
+    """Weight of one food-specific unit, e.g. a slice of white bread is 30 g."""
+    food = models.ForeignKey(Food, on_delete=models.CASCADE, related_name='portions')
+    unit = models.CharField(max_length=20)  # Canonical unit from api.units (slice, piece, ...)
+    grams = models.FloatField()
+
+    class Meta:
+        unique_together = ('food', 'unit')
+
+    def __str__(self):
+        return f"1 {self.unit} of {self.food.name} = {self.grams}g"
+
+
+class LLMExtraction(models.Model):
+    """Cached tool-call arguments for a normalized log text (see api.llm_cache)."""
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=50)
+    prompt_version = models.IntegerField()
+    extracted = models.JSONField()
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.model} v{self.prompt_version} ({len(self.extracted)} items)"
+
+
+
+class FoodLog(models.Model):
+    """One parsed /parse-log submission."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='food_logs')
+    text = models.TextField()
+    # Null for the undated days of a multi-day log ("Monday", "Day 2"), which
+    # count toward no DailyTotal
+    logged_on = models.DateField(null=True)
+    total_calories = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'logged_on'])]
+
+    def __str__(self):
+        return f"{self.user} on {self.logged_on} ({self.total_calories} cal)"
+
+
+class FoodLogItem(models.Model):
+    log = models.ForeignKey(FoodLog, on_delete=models.CASCADE, related_name='items')
+    food = models.ForeignKey(Food, on_delete=models.SET_NULL, null=True, related_name='log_items')
+    name = models.CharField(max_length=100)
+    quantity = models.CharField(max_length=50)
+    grams = models.FloatField()
+    calories = models.FloatField()
+    source = models.CharField(max_length=10)  # 'local' or 'llm'
+
+    def __str__(self):
+        return f"{self.quantity} {self.name} ({self.calories} cal)"
+
+
+class DailyTotal(models.Model):
+    """
+    Running per-user, per-day totals, updated in the same transaction as each
+    FoodLog insert so reads never have to aggregate raw items.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_totals')
+    date = models.DateField()
+    total_calories = models.FloatField(default=0)
+    item_count = models.IntegerField(default=0)
+    log_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'date')
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.user} on {self.date}: {self.total_calories} cal"
+
+
+class ParseJob(models.Model):
+    """A /parse-log?async=1 request waiting for (or done by) a parse_worker."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='parse_jobs')
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+class MissingFood(models.Model):
+    """
+    How often a food name or unit from a parsed log matched nothing.
+
+    Filled in batches by api.misses; `manage.py missing_foods` ranks them.
+    """
+    FOOD = 'food'
+    UNIT = 'unit'
+    KIND_CHOICES = [(FOOD, 'Food'), (UNIT, 'Unit')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    name = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('kind', 'name')
+        ordering = ['-count']
+
+    def __str__(self):
+        return f"{self.kind} '{self.name}' ({self.count} misses)"
+
+
+class CatalogVersion(models.Model):
+    """
+    Single row (pk=1) describing the current Food catalog, see api.versioning.
+
+    `counter` goes up on every committed write; `content_hash` is computed
+    lazily from the rows and cleared whenever the counter moves.
+    """
+    counter = models.BigIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Catalog v{self.counter} ({self.content_hash[:12] or 'unhashed'})"
+
+
+class CatalogSource(models.Model):
+    """What a population command last loaded, so an identical re-run can be skipped."""
+    command = models.CharField(max_length=50, unique=True)
+    source_hash = models.CharField(max_length=64)
+    catalog_hash = models.CharField(max_length=64)
+    applied_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.command} @ {self.source_hash[:12]}"
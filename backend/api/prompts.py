@@ -0,0 +1,104 @@
+"""
+The extraction prompt and tool schema shared by every LLM provider, and the
+helpers that turn tool calls into lookup_food_calories() argument dicts.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Tool definition in OpenAI format
+LOOKUP_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "lookup_food_calories",
+        "description": "Calculates calories for a specific food item",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "food_name": {
+                    "type": "string",
+                    "description": "The name of the food (e.g., 'eba', 'rice')"
+                },
+                "quantity": {
+                    "type": "number",
+                    "description": "The amount eaten"
+                },
+                "unit": {
+                    "type": "string",
+                    "description": "The unit of measurement (e.g., 'cup', 'gram', 'plate')"
+                }
+            },
+            "required": ["food_name", "quantity"]
+        }
+    }
+}
+
+LLM_MODEL = "gpt-4o-mini"
+
+# Bump whenever SYSTEM_PROMPT or LOOKUP_TOOL changes so cached extractions made
+# with the old prompt are not reused.
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = "You are a nutrition assistant. Extract food items, quantities, and units from the user's text. Call the 'lookup_food_calories' function for EACH food item found."
+
+
+def build_llm_messages(log_text):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": log_text}
+    ]
+
+
+def tool_calls_to_args(message):
+    """Turn the model's lookup_food_calories tool calls into argument dicts."""
+    logger.debug("LLM response", extra={"content": message.content})
+    
+    extracted = []
+    # Check if there are tool calls
+    if message.tool_calls:
+        for tool_call in message.tool_calls:
+            args = tool_call_to_args(tool_call.function.name, tool_call.function.arguments)
+            if args:
+                extracted.append(args)
+    return extracted
+
+
+def tool_call_to_args(name, arguments):
+    """Arguments dict for one lookup_food_calories call, or None for other tools."""
+    logger.debug("Tool call", extra={"tool": name, "arguments": arguments})
+    if name != 'lookup_food_calories':
+        return None
+    # OpenAI sends a JSON string, Gemini an already-parsed dict
+    args = json.loads(arguments) if isinstance(arguments, str) else dict(arguments or {})
+    return {
+        "food_name": args.get('food_name'),
+        "quantity": args.get('quantity'),
+        "unit": args.get('unit'),
+    }
+
+
+def gemini_tool():
+    """LOOKUP_TOOL as a google-genai Tool."""
+    from google.genai import types
+
+    function = LOOKUP_TOOL["function"]
+    return types.Tool(function_declarations=[
+        types.FunctionDeclaration(
+            name=function["name"],
+            description=function["description"],
+            parameters_json_schema=function["parameters"],
+        )
+    ])
+
+
+def function_calls_to_args(function_calls):
+    """Turn Gemini function calls into argument dicts, like tool_calls_to_args()."""
+    extracted = []
+    for call in function_calls or []:
+        args = tool_call_to_args(call.name, call.args)
+        if args:
+            extracted.append(args)
+    return extracted
@@ -0,0 +1,269 @@
+"""
+LLM providers and the router that picks one per request.
+
+Every provider turns a food log into the same normalized list of
+lookup_food_calories() argument dicts, so callers don't care who answered.
+The router keeps an EWMA of each provider's latency and error rate and sends
+each request to the one expected to answer soonest, falling through to the
+next when a call fails or a provider's breaker is open.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from api.llm_clients import gemini_api_key, get_async_openai_client, get_gemini_client, get_openai_client
+from api.prompts import LLM_MODEL, LOOKUP_TOOL, SYSTEM_PROMPT, build_llm_messages, function_calls_to_args, gemini_tool, tool_calls_to_args
+from api.resilience import CircuitOpenError, GuardedCaller, LLMDeadlineExceeded, remaining_time
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class LLMProvider:
+    """Base class; subclasses implement extract() and aextract()."""
+
+    name = None
+    # Recorded with the extractions it answers
+    model = None
+
+    def available(self):
+        """Whether the provider is configured (e.g. has an API key)."""
+        return True
+
+    def extract(self, log_text):
+        raise NotImplementedError
+
+    async def aextract(self, log_text):
+        raise NotImplementedError
+
+
+def _until_deadline(client):
+    # End the HTTP request itself at the guard's deadline; retrying is the
+    # guard's (and the router's) job
+    remaining = remaining_time()
+    if remaining is None:
+        return client
+    return client.with_options(timeout=remaining, max_retries=0)
+
+
+class OpenAIProvider(LLMProvider):
+    name = 'openai'
+    model = LLM_MODEL
+
+    def available(self):
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def extract(self, log_text):
+        response = _until_deadline(get_openai_client()).chat.completions.create(
+            model=self.model,
+            messages=build_llm_messages(log_text),
+            tools=[LOOKUP_TOOL],
+            tool_choice="auto"
+        )
+        return tool_calls_to_args(response.choices[0].message)
+
+    async def aextract(self, log_text):
+        response = await _until_deadline(get_async_openai_client()).chat.completions.create(
+            model=self.model,
+            messages=build_llm_messages(log_text),
+            tools=[LOOKUP_TOOL],
+            tool_choice="auto"
+        )
+        return tool_calls_to_args(response.choices[0].message)
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def available(self):
+        return bool(gemini_api_key())
+
+    @property
+    def model(self):
+        return _setting('GEMINI_MODEL', 'gemini-2.0-flash')
+
+    def _config(self):
+        from google.genai import types
+
+        remaining = remaining_time()
+        return types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=max(1, int(remaining * 1000))) if remaining else None,
+            system_instruction=SYSTEM_PROMPT,
+            tools=[gemini_tool()],
+            # We resolve the calls ourselves
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+        )
+
+    def extract(self, log_text):
+        response = get_gemini_client().models.generate_content(
+            model=self.model,
+            contents=log_text,
+            config=self._config(),
+        )
+        return function_calls_to_args(response.function_calls)
+
+    async def aextract(self, log_text):
+        response = await get_gemini_client().aio.models.generate_content(
+            model=self.model,
+            contents=log_text,
+            config=self._config(),
+        )
+        return function_calls_to_args(response.function_calls)
+
+
+PROVIDER_CLASSES = {
+    OpenAIProvider.name: OpenAIProvider,
+    GeminiProvider.name: GeminiProvider,
+}
+
+
+class ProviderStats:
+    """Exponentially weighted latency and error rate of one provider."""
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, seconds, ok):
+        a = self.alpha
+        self.latency = seconds if self.latency is None else a * seconds + (1 - a) * self.latency
+        self.error_rate = a * (0 if ok else 1) + (1 - a) * self.error_rate
+        self.calls += 1
+        self.errors += 0 if ok else 1
+
+    def score(self):
+        """Expected seconds to a successful answer; 0 until measured so new providers get tried."""
+        if self.latency is None:
+            return 0.0
+        return self.latency / (1 - min(self.error_rate, 0.95))
+
+
+class ProviderRouter:
+    def __init__(self, providers, alpha=None, explore=None):
+        self.providers = list(providers)
+        self.alpha = alpha if alpha is not None else _setting('LLM_ROUTER_ALPHA', 0.2)
+        # Share of requests sent to a random provider, so one that had a bad
+        # spell gets measured again instead of being avoided forever
+        self.explore = explore if explore is not None else _setting('LLM_ROUTER_EXPLORE', 0.05)
+        self.stats_by_name = {p.name: ProviderStats(self.alpha) for p in self.providers}
+        # One breaker (and hedging history) per vendor
+        self.guards = {p.name: GuardedCaller() for p in self.providers}
+        self._lock = threading.Lock()
+
+    def available(self):
+        return any(p.available() for p in self.providers)
+
+    def ranked(self):
+        """Configured providers, best first."""
+        providers = [p for p in self.providers if p.available()]
+        with self._lock:
+            # sorted() is stable, so ties keep the configured order
+            providers.sort(key=lambda p: self.stats_by_name[p.name].score())
+        if len(providers) > 1 and random.random() < self.explore:
+            providers.insert(0, providers.pop(random.randrange(1, len(providers))))
+        return providers
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.stats_by_name[name].record(seconds, ok)
+
+    def record_failure(self, name, seconds):
+        # A fast error is no better than a timeout for the user, so it counts
+        # as taking the whole deadline
+        self.record(name, max(seconds, _setting('LLM_DEADLINE', 10)), ok=False)
+
+    def extract(self, log_text):
+        """Argument dicts for log_text from whichever provider answers; see answer()."""
+        return self.answer(log_text)[0]
+
+    async def aextract(self, log_text):
+        """Async version of extract()."""
+        return (await self.aanswer(log_text))[0]
+
+    def answer(self, log_text):
+        """
+        Extract with the best provider, falling through on failure.
+
+        Returns (argument dicts, "provider:model" of the one that answered).
+
+        One LLM_DEADLINE covers the whole fall-through: each provider only
+        gets the time the ones before it left. Raises CircuitOpenError when no
+        provider could be tried, LLMDeadlineExceeded when the time ran out
+        before one could, otherwise the last provider's error.
+        """
+        deadline = time.monotonic() + _setting('LLM_DEADLINE', 10)
+        error = None
+        for provider in self.ranked():
+            start = time.monotonic()
+            if start >= deadline:
+                error = error or LLMDeadlineExceeded("LLM deadline passed before trying every provider")
+                break
+            try:
+                result = self.guards[provider.name].call(provider.extract, log_text, deadline=deadline)
+            except CircuitOpenError:
+                continue
+            except Exception as e:
+                logger.warning("LLM provider failed", extra={"provider": provider.name, "error": str(e)})
+                self.record_failure(provider.name, time.monotonic() - start)
+                error = e
+                continue
+            self.record(provider.name, time.monotonic() - start, ok=True)
+            return result, f"{provider.name}:{provider.model}"
+        raise error or CircuitOpenError("No LLM provider available")
+
+    async def aanswer(self, log_text):
+        """Async version of answer()."""
+        deadline = time.monotonic() + _setting('LLM_DEADLINE', 10)
+        error = None
+        for provider in self.ranked():
+            start = time.monotonic()
+            if start >= deadline:
+                error = error or LLMDeadlineExceeded("LLM deadline passed before trying every provider")
+                break
+            try:
+                result = await self.guards[provider.name].acall(provider.aextract, log_text, deadline=deadline)
+            except CircuitOpenError:
+                continue
+            except Exception as e:
+                logger.warning("LLM provider failed", extra={"provider": provider.name, "error": str(e)})
+                self.record_failure(provider.name, time.monotonic() - start)
+                error = e
+                continue
+            self.record(provider.name, time.monotonic() - start, ok=True)
+            return result, f"{provider.name}:{provider.model}"
+        raise error or CircuitOpenError("No LLM provider available")
+
+    def stats(self):
+        with self._lock:
+            providers = {
+                name: {
+                    'ewma_latency_seconds': round(s.latency, 3) if s.latency is not None else None,
+                    'ewma_error_rate': round(s.error_rate, 3),
+                    'calls': s.calls,
+                    'errors': s.errors,
+                }
+                for name, s in self.stats_by_name.items()
+            }
+        for provider in self.providers:
+            providers[provider.name]['available'] = provider.available()
+            providers[provider.name]['guard'] = self.guards[provider.name].stats()
+        return providers
+
+
+def build_router():
+    names = [n.strip() for n in _setting('LLM_PROVIDERS', 'openai,gemini').split(',') if n.strip()]
+    return ProviderRouter([PROVIDER_CLASSES[name]() for name in names])
+
+
+llm_router = build_router()
@@ -0,0 +1,305 @@
+"""
+Tail-latency control around the LLM call.
+
+- A deadline per extraction, so a slow upstream can't hold a worker for as
+  long as the SDK's own retries allow.
+- Optional hedging: if the first request hasn't answered within the recent
+  p95 latency, a second identical request is sent and whichever answers
+  first wins.
+- A circuit breaker: after repeated failures calls are refused straight away
+  (callers fall back to the degraded local parse) until a cool-down passes
+  and a single trial call succeeds.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the breaker is open."""
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Monotonic deadline of the guarded call running in this context
+_deadline = contextvars.ContextVar('llm_call_deadline', default=None)
+
+
+def remaining_time():
+    """
+    Seconds left before the current guarded call's deadline, or None outside one.
+
+    Providers pass this to the SDK as the request timeout (with no SDK
+    retries), so an abandoned call frees its pool thread at the deadline
+    instead of running on for LLM_TIMEOUT x (1 + LLM_MAX_RETRIES). Raises
+    LLMDeadlineExceeded if the call waited in the pool past its deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise LLMDeadlineExceeded("LLM deadline passed before the call started")
+    return remaining
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or _setting('LLM_BREAKER_FAILURES', 5)
+        self.reset_timeout = reset_timeout or _setting('LLM_BREAKER_RESET', 30)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trial_started = None
+        self.counters = {'opened': 0, 'rejected': 0, 'successes': 0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead right now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.counters['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                # Let exactly one trial call through. A trial nobody reported
+                # back on within reset_timeout is given up, so a lost one
+                # can't keep the breaker half-open forever.
+                now = time.monotonic()
+                if self.trial_in_flight and now - self.trial_started < self.reset_timeout:
+                    self.counters['rejected'] += 1
+                    return False
+                self.trial_in_flight = True
+                self.trial_started = now
+            return True
+
+    def release(self):
+        """
+        A call that allow() let through ended with no verdict on the upstream
+        (the request was cancelled or the client went away): free the trial.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.counters['successes'] += 1
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.counters['failures'] += 1
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.counters['opened'] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                **self.counters,
+            }
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for picking the hedge delay."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * pct / 100))
+        return samples[index]
+
+
+class GuardedCaller:
+    """Runs LLM calls with a deadline, optional hedging and a circuit breaker."""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.counters = {'calls': 0, 'timeouts': 0, 'hedges_sent': 0, 'hedge_wins': 0}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=_setting('LLM_CALL_POOL_SIZE', 32),
+                        thread_name_prefix='llm-call',
+                    )
+        return self._pool
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None when hedging is off or untrained."""
+        if not _setting('LLM_HEDGE', False):
+            return None
+        if len(self.latency.samples) < _setting('LLM_HEDGE_MIN_SAMPLES', 20):
+            return None
+        p = self.latency.percentile(_setting('LLM_HEDGE_PERCENTILE', 95))
+        return max(p, _setting('LLM_HEDGE_MIN_DELAY', 0.5))
+
+    def _submit(self, deadline, fn, *args):
+        # Carry the caller's context (e.g. request timings) into the thread,
+        # plus the deadline for remaining_time()
+        context = contextvars.copy_context()
+        context.run(_deadline.set, deadline)
+        return self.pool.submit(context.run, fn, *args)
+
+    def call(self, fn, *args, deadline=None):
+        """
+        Call fn(*args) in the pool and return its result.
+
+        `deadline` is a time.monotonic() value, LLM_DEADLINE seconds from now
+        by default. Raises CircuitOpenError without calling when the breaker is
+        open, LLMDeadlineExceeded at the deadline, or fn's own error.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        self._count('calls')
+        start = time.monotonic()
+        deadline = deadline or start + _setting('LLM_DEADLINE', 10)
+
+        futures = [self._submit(deadline, fn, *args)]
+        hedge_after = self.hedge_delay()
+        error = None
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = remaining
+            if hedge_after is not None and len(futures) == 1:
+                timeout = min(remaining, max(0, start + hedge_after - time.monotonic()))
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count('hedge_wins')
+                    self._succeed(start)
+                    return future.result()
+                error = future.exception()
+                futures.remove(future)
+
+            if not futures:
+                # Every request failed
+                self.breaker.record_failure()
+                raise error
+            if not done and hedge_after is not None and len(futures) == 1 and error is None:
+                self._count('hedges_sent')
+                futures.append(self._submit(deadline, fn, *args))
+
+        self._count('timeouts')
+        self.breaker.record_failure()
+        raise LLMDeadlineExceeded(f"LLM call exceeded its {deadline - start:.1f}s deadline")
+
+    async def acall(self, fn, *args, deadline=None):
+        """Async version of call() for coroutine functions."""
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        self._count('calls')
+        start = time.monotonic()
+        deadline = deadline or start + _setting('LLM_DEADLINE', 10)
+
+        # Tasks copy the context when they're created
+        token = _deadline.set(deadline)
+        tasks = [asyncio.ensure_future(fn(*args))]
+        hedge_after = self.hedge_delay()
+        error = None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                timeout = remaining
+                if hedge_after is not None and len(tasks) == 1:
+                    timeout = min(remaining, max(0, start + hedge_after - time.monotonic()))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count('hedge_wins')
+                        self._succeed(start)
+                        return task.result()
+                    error = task.exception()
+                    tasks.remove(task)
+
+                if not tasks:
+                    self.breaker.record_failure()
+                    raise error
+                if not done and hedge_after is not None and len(tasks) == 1 and error is None:
+                    self._count('hedges_sent')
+                    tasks.append(asyncio.ensure_future(fn(*args)))
+        except asyncio.CancelledError:
+            # The request was cancelled (e.g. the ASGI client disconnected)
+            # before the upstream answered: that says nothing about its health
+            self.breaker.release()
+            raise
+        finally:
+            _deadline.reset(token)
+            for task in tasks:
+                task.cancel()
+
+        self._count('timeouts')
+        self.breaker.record_failure()
+        raise LLMDeadlineExceeded(f"LLM call exceeded its {deadline - start:.1f}s deadline")
+
+    def _succeed(self, start):
+        self.latency.add(time.monotonic() - start)
+        self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        p95 = self.latency.percentile(95)
+        return {
+            **counters,
+            'p95_seconds': round(p95, 3) if p95 is not None else None,
+            'hedge_delay_seconds': self.hedge_delay(),
+            'breaker': self.breaker.stats(),
+        }
+
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.catalog import invalidate_catalog
+from api.models import Food, FoodPortion
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+@receiver(post_save, sender=FoodPortion)
+@receiver(post_delete, sender=FoodPortion)
+def food_changed(sender, **kwargs):
+    # Covers the admin, update_or_create() and .save(); bulk operations do not
+    # send signals, so those callers invalidate the catalog themselves.
+    invalidate_catalog()
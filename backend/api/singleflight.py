@@ -0,0 +1,237 @@
+"""
+Coalescing of identical in-flight LLM extractions.
+
+Within a process, the first request for a key runs the extraction and any
+identical request arriving meanwhile waits on its Future and gets the same
+result (or error). Nothing is kept once the call finishes, so later requests
+go through the normal cache path.
+
+Across worker processes, the leader also takes an flock() on a lock file
+named after the key. A worker that had to wait for that lock re-reads the
+extraction cache first, so it picks up what the other worker just stored
+instead of calling the LLM again.
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.counters = {'leaders': 0, 'followers': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            self._count('followers')
+            return future.result()
+
+        self._count('leaders')
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self, key):
+        """Whether a call for `key` is running in this process."""
+        with self._lock:
+            return key in self._calls
+
+    @contextmanager
+    def lead(self, key):
+        """
+        Register the block as the call for `key`, for work that can't be
+        passed to do() as a function (a streamed extraction).
+
+        do() callers arriving meanwhile wait for the result set on the yielded
+        Future; if the block ends without one they get an error. If another
+        call got to `key` first the block simply runs on its own.
+        """
+        future = Future()
+        with self._lock:
+            registered = self._calls.setdefault(key, future) is future
+        self._count('leaders')
+        try:
+            yield future
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.set_exception(RuntimeError("The leading call ended without a result"))
+            # Nobody may be waiting
+            future.exception()
+            if registered:
+                with self._lock:
+                    del self._calls[key]
+
+    async def ado(self, key, fn):
+        """Async version of do(); fn is a coroutine function."""
+        call_key = (id(asyncio.get_running_loop()), key)
+        future = self._async_calls.get(call_key)
+        if future is not None:
+            self._count('followers')
+            return await asyncio.shield(future)
+
+        future = self._async_calls[call_key] = asyncio.get_running_loop().create_future()
+        self._count('leaders')
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Don't warn about an unretrieved exception when nobody was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[call_key]
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'in_flight': len(self._calls) + len(self._async_calls)}
+
+
+class KeyFileLock:
+    """
+    Cross-process exclusive lock per key, using one lock file per key.
+
+    The holder deletes the file before unlocking, so lock files don't pile up.
+    A waiter that then gets the lock on the deleted file notices the inode
+    changed and locks the new file instead.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = (
+            directory
+            or _setting('LLM_SINGLEFLIGHT_LOCK_DIR', None)
+            or os.path.join(tempfile.gettempdir(), 'health-app-llm-locks')
+        )
+        self.counters = {'acquired': 0, 'waited': 0, 'timeouts': 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.lock')
+
+    def _try_acquire(self, key):
+        """Open file locked by us, or None if someone else holds the lock."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        while True:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(f.fileno()).st_ino:
+                return f
+            # Locked a file the previous holder already deleted; go again
+            f.close()
+
+    def _release(self, key, f):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+    def _timeout(self):
+        return _setting('LLM_DEADLINE', 10) + 5
+
+    @contextmanager
+    def hold(self, key):
+        """
+        Hold the lock for key; yields whether we had to wait for another holder.
+
+        Gives up waiting after the LLM deadline (plus a margin) and runs
+        without the lock rather than failing the request.
+        """
+        if fcntl is None:
+            yield False
+            return
+        deadline = time.monotonic() + self._timeout()
+        f = self._try_acquire(key)
+        waited = f is None
+        while f is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            f = self._try_acquire(key)
+        self._record(f is not None, waited)
+        try:
+            yield waited
+        finally:
+            if f is not None:
+                self._release(key, f)
+
+    @asynccontextmanager
+    async def ahold(self, key):
+        """Async version of hold() that polls without blocking the event loop."""
+        if fcntl is None:
+            yield False
+            return
+        deadline = time.monotonic() + self._timeout()
+        f = self._try_acquire(key)
+        waited = f is None
+        while f is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            f = self._try_acquire(key)
+        self._record(f is not None, waited)
+        try:
+            yield waited
+        finally:
+            if f is not None:
+                self._release(key, f)
+
+    def _record(self, acquired, waited):
+        # Plain increments; these are only indicative
+        self.counters['acquired' if acquired else 'timeouts'] += 1
+        if waited:
+            self.counters['waited'] += 1
+
+    def stats(self):
+        return {**self.counters, 'enabled': fcntl is not None}
+
+
+singleflight = SingleFlight()
+extraction_locks = KeyFileLock()
@@ -0,0 +1,82 @@
+"""
+Prefix index for food-name autocomplete (GET /foods/suggest?q=).
+
+Every word start of every name ("jollof rice", "rice") goes into one sorted
+list, so the names matching a prefix are a contiguous slice found with two
+bisects. Candidates are ranked by how often the food was logged (FoodLogItem
+counts loaded with the snapshot). Short prefixes can match a large part of
+the catalog, so every prefix matching more than PRECOMPUTE_ABOVE keys has
+its top results precomputed when the index is built; any other query ranks
+at most that many candidates. Nothing here touches the database.
+"""
+
+import heapq
+from bisect import bisect_left
+
+from api.catalog import normalize_name
+
+MAX_SUGGESTIONS = 10
+# Prefixes matching more keys than this get their results precomputed
+PRECOMPUTE_ABOVE = 128
+
+
+class SuggestIndex:
+    def __init__(self, entries, popularity):
+        self.entries = entries
+        # Position of each entry in the overall ranking: most logged first,
+        # then shorter names, then alphabetical
+        order = sorted(
+            range(len(entries)),
+            key=lambda i: (-popularity.get(entries[i].id, 0), len(entries[i].name), entries[i].name),
+        )
+        self.rank = [0] * len(entries)
+        for position, i in enumerate(order):
+            self.rank[i] = position
+
+        keys = []
+        for i, entry in enumerate(entries):
+            name = normalize_name(entry.name)
+            start = 0
+            for word in name.split(' '):
+                keys.append((name[start:], i))
+                start += len(word) + 1
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.owners = [i for _, i in keys]
+
+        self.precomputed = {}
+        # Split big ranges one character at a time until every range is small
+        ranges = [(0, len(self.keys))]
+        length = 0
+        while ranges:
+            length += 1
+            smaller = []
+            for lo, hi in ranges:
+                i = lo
+                while i < hi:
+                    if len(self.keys[i]) < length:
+                        i += 1
+                        continue
+                    prefix = self.keys[i][:length]
+                    end = bisect_left(self.keys, prefix + '\uffff', i, hi)
+                    if end - i > PRECOMPUTE_ABOVE:
+                        self.precomputed[prefix] = self._top(set(self.owners[i:end]), MAX_SUGGESTIONS)
+                        smaller.append((i, end))
+                    i = end
+            ranges = smaller
+
+    def _top(self, candidates, limit):
+        return heapq.nsmallest(limit, candidates, key=self.rank.__getitem__)
+
+    def search(self, query, limit=MAX_SUGGESTIONS):
+        """Top `limit` catalog entries with a word starting with `query`."""
+        query = normalize_name(query)
+        limit = max(0, min(limit, MAX_SUGGESTIONS))
+        if not query or not limit:
+            return []
+        found = self.precomputed.get(query)
+        if found is None:
+            lo = bisect_left(self.keys, query)
+            hi = bisect_left(self.keys, query + '\uffff', lo)
+            found = self._top(set(self.owners[lo:hi]), limit)
+        return [self.entries[i] for i in found[:limit]]
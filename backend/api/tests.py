@@ -1,3 +1,980 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace as NS
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import openai
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.async_views import parse_log_async
+from api.catalog import get_catalog, invalidate_catalog, refresh_catalog
+from api.llm_cache import cache_key, extraction_cache
+from api.llm_clients import client_stats, get_openai_client, reset_clients
+from api.food_logs import record_food_log
+from api.fuzzy import best_matches
+from api.jobs import claim_job, enqueue_parse_job
+from api.management.commands.loadtest import LLMStub, latency_sampler
+from api.metrics import request_queries
+from api.misses import MissRecorder
+from api.models import CatalogVersion, Food, FoodLog, FoodLogItem, FoodPortion, LLMExtraction, MissingFood
+from api.prompts import LLM_MODEL, PROMPT_VERSION, tool_calls_to_args
+from api.providers import LLMProvider, OpenAIProvider, ProviderRouter
+from api.resilience import CircuitBreaker, GuardedCaller, LLMDeadlineExceeded
+from api.singleflight import KeyFileLock, extraction_locks, singleflight
+from api.timing import collect_timings, timed
+from api.units import is_single_quantity, normalize_unit, parse_quantity
+from api.utils import (
+    extract_with_llm, lookup_food_calories, lookup_foods_calories, parse_food_log, parse_food_logs,
+    parse_long_food_log, resolve_extracted, split_log_chunks, stream_food_log, total_nutrients,
+)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        foods = [('eba', 360), ('egusi soup', 593), ('basmati rice', 121), ('white rice', 130)]
+        # Run the catalog-change callback now; a pending one would cover the
+        # saves the tests make in the same (never committed) test transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, calories in foods:
+                Food.objects.create(name=name, calories_per_100g=calories, unit='g')
+        refresh_catalog()
+
+    def test_lookups_make_no_queries_once_warm(self):
+        with self.assertNumQueries(0):
+            for _ in range(8):
+                result = lookup_food_calories('Eba', 2, 'cup')
+        self.assertEqual(result['total_calories'], 360 * 2 * 2.4)
+
+    def test_saving_a_food_refreshes_the_snapshot(self):
+        version = get_catalog().version
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.create(name='amala', calories_per_100g=250, unit='g')
+        self.assertGreater(get_catalog().version, version)
+        self.assertIsNotNone(get_catalog().get('amala'))
+
+    def test_fuzzy_fallback_ranks_by_similarity_not_name_order(self):
+        # icontains + ordering by name used to pick 'basmati rice' here
+        result = lookup_food_calories('rice', 1)
+        self.assertEqual(result['item'], 'white rice')
+        self.assertIn('match_score', result)
+        self.assertIn('error', lookup_food_calories('zobo', 1))
+
+    @override_settings(FOOD_FUZZY_BACKEND='postgres', FOOD_FUZZY_THRESHOLD=0.2)
+    def test_postgres_fuzzy_query_uses_the_configured_threshold(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchall.return_value = []
+        with mock.patch.object(connection, 'cursor', return_value=cursor):
+            self.assertEqual(best_matches(get_catalog(), ['rice']), {})
+        executed = [c.args for c in cursor.__enter__.return_value.execute.call_args_list]
+        self.assertIn(("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", ['0.2']), executed)
+
+
+class LocalParserTests(TestCase):
+    def setUp(self):
+        for name, calories in [('eba', 360), ('egusi', 500), ('egusi soup', 593), ('rice', 130)]:
+            Food.objects.create(name=name, calories_per_100g=calories, unit='g')
+        refresh_catalog()
+
+    def test_trivial_log_never_calls_the_llm(self):
+        with mock.patch('api.utils.extract_with_llm') as llm:
+            items, total = parse_food_log("Lunch: 2 cups eba, 1 plate of Egusi Soup")
+        llm.assert_not_called()
+        self.assertEqual([i['item'] for i in items], ['eba', 'egusi soup'])
+        self.assertEqual({i['source'] for i in items}, {'local'})
+        self.assertEqual(total, round(360 * 2 * 2.4 + 593 * 2.5, 2))
+
+    def test_only_unresolved_segments_go_to_the_llm(self):
+        llm_args = [{'food_name': 'rice', 'quantity': 1, 'unit': 'plate'}]
+        with mock.patch('api.utils.extract_with_llm', return_value=llm_args) as llm:
+            items, _ = parse_food_log("1 half eaten bowl of fried rice\n1/2 cup eba")
+        llm.assert_called_once_with("1 half eaten bowl of fried rice")
+        self.assertEqual([(i['item'], i['source']) for i in items], [('eba', 'local'), ('rice', 'llm')])
+
+    def test_a_food_before_a_colon_is_not_mistaken_for_a_label(self):
+        with mock.patch('api.utils.extract_with_llm') as llm:
+            items, _ = parse_food_log("eba: 2 cups\nEgusi Soup: 1 plate\nLunch: 1 cup rice")
+        llm.assert_not_called()
+        self.assertEqual([(i['item'], i['quantity']) for i in items], [
+            ('eba', '2.0 cup'), ('egusi soup', '1.0 plate'), ('rice', '1.0 cup'),
+        ])
+
+        # The LLM gets unresolved text as written, food name included
+        with mock.patch('api.utils.extract_with_llm', return_value=[]) as llm:
+            parse_food_log("Eba: a lot")
+        llm.assert_called_once_with("Eba: a lot")
+
+    def test_a_number_between_two_foods_belongs_to_the_next_one(self):
+        with mock.patch('api.utils.extract_with_llm') as llm:
+            items, _ = parse_food_log("2 eba 3 rice\negusi soup 1 plate")
+        llm.assert_not_called()
+        self.assertEqual(
+            [(i['item'], i['quantity']) for i in items],
+            [('eba', '2.0 g'), ('rice', '3.0 g'), ('egusi soup', '1.0 plate')],
+        )
+
+        # Ranges and runs of numbers aren't added up either
+        for log in ["1-2 cups eba", "100 200g rice", "2 3 eba"]:
+            with mock.patch('api.utils.extract_with_llm', return_value=[]) as llm:
+                parse_food_log(log)
+            llm.assert_called_once_with(log)
+        with mock.patch('api.utils.extract_with_llm') as llm:
+            items, _ = parse_food_log("1 1/2 cups eba, 1½ cups rice, twenty five g egusi")
+        llm.assert_not_called()
+        self.assertEqual([i['quantity'] for i in items], ['1.5 cup', '1.5 cup', '25.0 g'])
+
+        # A number on both sides of one food is not added up; the LLM decides
+        with mock.patch('api.utils.extract_with_llm', return_value=[]) as llm:
+            parse_food_log("2 eba 3")
+        llm.assert_called_once_with("2 eba 3")
+
+
+@mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'test'})
+class ExtractionCacheTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='jollof rice', calories_per_100g=130, unit='g')
+        refresh_catalog()
+        extraction_cache.memory.clear()
+
+    def test_repeat_logs_skip_the_llm_and_survive_a_restart(self):
+        llm_args = [{'food_name': 'jollof rice', 'quantity': 1, 'unit': 'plate'}]
+        with mock.patch('api.utils.request_extraction', return_value=(llm_args, 'gemini:gemini-2.0-flash')) as llm:
+            parse_food_log("Some jollof rice")
+            extraction_cache.memory.clear()  # only the database tier is left
+            items, _ = parse_food_log("  some JOLLOF rice ")
+        llm.assert_called_once()
+        self.assertEqual(items[0]['item'], 'jollof rice')
+        self.assertEqual(extraction_cache.stats()['db_total_hits'], 1)
+        # Labelled by whoever answered, not the default OpenAI model
+        self.assertEqual(LLMExtraction.objects.get().model, 'gemini:gemini-2.0-flash')
+
+
+@mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'test'})
+class AsyncParseLogTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='jollof rice', calories_per_100g=130, unit='g')
+        refresh_catalog()
+        extraction_cache.memory.clear()
+        self.user = User.objects.create_user(username='ada', password='pw')
+        self.factory = AsyncRequestFactory()
+
+    def post(self, body, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.factory.post('/parse-log', body, content_type='application/json', headers=headers)
+
+    async def test_requires_a_valid_jwt(self):
+        response = await parse_log_async(self.post({'foodLog': 'rice'}))
+        self.assertEqual(response.status_code, 401)
+        response = await parse_log_async(self.post({'foodLog': 'rice'}, token='garbage'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_parses_with_the_async_client(self):
+        llm_args = [{'food_name': 'jollof rice', 'quantity': 1, 'unit': 'plate'}]
+        token = str(AccessToken.for_user(self.user))
+        with mock.patch('api.utils.arequest_extraction', return_value=(llm_args, 'openai:gpt-4o-mini')):
+            response = await parse_log_async(self.post({'foodLog': 'Some jollof'}, token=token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['total_calories'], 325.0)
+
+
+@mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'test'})
+class BatchParseTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        Food.objects.create(name='jollof rice', calories_per_100g=130, unit='g')
+        refresh_catalog()
+
+    def test_errors_are_isolated_per_log(self):
+        def fake_llm(text, raise_errors=False):
+            if 'boom' in text:
+                raise RuntimeError('upstream timeout')
+            return [{'food_name': 'jollof rice', 'quantity': 1, 'unit': 'plate'}]
+
+        with mock.patch('api.utils.extract_with_llm', side_effect=fake_llm):
+            results = parse_food_logs(["2 cups eba", "some jollof", "boom"])
+        self.assertEqual([r['status'] for r in results], ['success', 'success', 'error'])
+        self.assertEqual(results[1]['parsed_items'][0]['source'], 'llm')
+        self.assertEqual(results[2]['error'], 'upstream timeout')
+
+    def test_multi_day_logs_are_parsed_per_day_in_parallel(self):
+        # Both LLM chunks must be in flight at once to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_llm(text, raise_errors=False):
+            barrier.wait()
+            if 'boom' in text:
+                raise RuntimeError('upstream timeout')
+            return [{'food_name': 'jollof rice', 'quantity': 1, 'unit': 'plate'}]
+
+        log = "Monday:\n2 cups eba\nTuesday - some jollof\nWednesday:\nboom"
+        self.assertEqual([c['label'] for c in split_log_chunks(log)], ['Monday', 'Tuesday', 'Wednesday'])
+        with mock.patch('api.utils.extract_with_llm', side_effect=fake_llm):
+            items, total, chunks = parse_long_food_log(log)
+
+        self.assertEqual([(i['item'], i['chunk']) for i in items], [('eba', 0), ('jollof rice', 1)])
+        self.assertEqual([c['status'] for c in chunks], ['success', 'success', 'error'])
+        self.assertEqual(total, round(chunks[0]['total_calories'] + chunks[1]['total_calories'], 2))
+        self.assertEqual(parse_long_food_log("2 cups eba")[2], None)
+
+    def test_day_and_meal_headers_never_reach_the_llm(self):
+        log = "Monday\nBreakfast\n2 cups eba\nTuesday\nDay 2 - 3 plates jollof rice\n2024-05-01\n1 cup eba"
+        with mock.patch('api.utils.extract_with_llm') as llm:
+            items, _, chunks = parse_long_food_log(log)
+        llm.assert_not_called()
+        self.assertEqual([i['item'] for i in items], ['eba', 'jollof rice', 'eba'])
+        self.assertEqual(len(chunks), 4)
+
+    def test_llm_time_inside_chunks_is_reported(self):
+        def fake_llm(text, raise_errors=False):
+            with timed('llm'):
+                return [{'food_name': 'jollof rice', 'quantity': 1, 'unit': 'plate'}]
+
+        with mock.patch('api.utils.extract_with_llm', side_effect=fake_llm), collect_timings() as timings:
+            parse_long_food_log("Monday\nsome jollof\nTuesday\nmore jollof")
+        self.assertIn('llm', timings)
+
+
+def tool_call_chunk(index, name=None, arguments=None):
+    fragment = NS(index=index, function=NS(name=name, arguments=arguments))
+    return NS(choices=[NS(delta=NS(tool_calls=[fragment]))])
+
+
+@mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'test'})
+class StreamParseTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        Food.objects.create(name='jollof rice', calories_per_100g=130, unit='g')
+        refresh_catalog()
+        extraction_cache.memory.clear()
+        # The client is cached per process; don't keep (or reuse) a patched one
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_items_are_emitted_as_each_tool_call_completes(self):
+        seen = []
+
+        def chunks():
+            yield tool_call_chunk(0, 'lookup_food_calories', '{"food_name": "jollof')
+            yield tool_call_chunk(0, None, ' rice", "quantity": 1, "unit": "plate"}')
+            yield tool_call_chunk(1, 'lookup_food_calories', '{"food_name": "eba", "quantity": 1}')
+            seen.append('stream finished')
+
+        client = mock.Mock()
+        client.with_options.return_value = client
+        client.chat.completions.create.return_value = chunks()
+        with mock.patch('openai.OpenAI', return_value=client):
+            events = stream_food_log("some jollof, eba")
+            first = next(events)
+            self.assertEqual(seen, [])  # emitted before the rest of the stream was read
+            rest = list(events)
+
+        self.assertEqual(first['item']['item'], 'jollof rice')
+        self.assertEqual(rest[0]['running_total'], 325.0 + 360.0)
+        self.assertEqual(rest[-1]['total_calories'], 685.0)
+        self.assertEqual(rest[-1]['item_count'], 2)
+        self.assertEqual(client.with_options.call_args.kwargs['max_retries'], 0)
+
+    def test_a_failed_stream_ends_with_a_degraded_parse(self):
+        def chunks():
+            yield tool_call_chunk(0, 'lookup_food_calories', '{"food_name": "jollof rice", "quantity": 1}')
+            yield tool_call_chunk(1, 'lookup_food_calories', '{"food_name": "eba"')
+            raise openai.APIConnectionError(request=mock.Mock())
+
+        client = mock.Mock()
+        client.with_options.return_value = client
+        client.chat.completions.create.return_value = chunks()
+        with mock.patch('openai.OpenAI', return_value=client):
+            events = list(stream_food_log("leftover jollof rice mashed into 2 cups of eba"))
+
+        self.assertEqual(
+            [(e['item']['item'], e['item']['source']) for e in events[:-1]],
+            [('jollof rice', 'llm'), ('eba', 'degraded')],
+        )
+        self.assertEqual(events[-1]['type'], 'done')
+
+    @override_settings(LLM_DEADLINE=0.05)
+    def test_a_slow_stream_stops_at_the_deadline(self):
+        def chunks():
+            yield tool_call_chunk(0, 'lookup_food_calories', '{"food_name": "eba", "quantity": 1}')
+            time.sleep(0.1)
+            yield tool_call_chunk(1, 'lookup_food_calories', '{"food_name": "jollof rice", "quantity": 1}')
+            yield tool_call_chunk(2, 'lookup_food_calories', '{"food_name": "eba", "quantity": 3}')
+
+        client = mock.Mock()
+        client.with_options.return_value = client
+        client.chat.completions.create.return_value = chunks()
+        with mock.patch('openai.OpenAI', return_value=client):
+            events = list(stream_food_log("some eba"))
+
+        self.assertEqual([e['item']['source'] for e in events[:-1]], ['degraded'])
+        self.assertEqual(client.with_options.call_args.kwargs['timeout'], 0.05)
+
+    def test_a_disconnect_mid_stream_frees_the_breaker_trial(self):
+        def chunks():
+            yield tool_call_chunk(0, 'lookup_food_calories', '{"food_name": "eba", "quantity": 1}')
+            yield tool_call_chunk(1, 'lookup_food_calories', '{"food_name": "jollof rice", "quantity": 1}')
+
+        client = mock.Mock()
+        client.with_options.return_value = client
+        client.chat.completions.create.return_value = chunks()
+        router = ProviderRouter([OpenAIProvider()], explore=0)
+        breaker = router.guards['openai'].breaker
+        breaker.state = breaker.HALF_OPEN
+        with mock.patch('openai.OpenAI', return_value=client), mock.patch('api.utils.llm_router', router):
+            events = stream_food_log("some eba, jollof")
+            next(events)
+            events.close()
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertTrue(breaker.allow())
+
+
+@mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'test'})
+class LLMClientTests(TestCase):
+    def setUp(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    @override_settings(LLM_HTTP_MAX_CONNECTIONS=7, LLM_HTTP_MAX_KEEPALIVE=3)
+    def test_one_pooled_client_per_process(self):
+        with mock.patch('openai.DefaultHttpxClient', wraps=openai.DefaultHttpxClient) as http_client:
+            client = get_openai_client()
+            self.assertIs(get_openai_client(), client)
+        http_client.assert_called_once()
+        limits = http_client.call_args.kwargs['limits']
+        self.assertEqual((limits.max_connections, limits.max_keepalive_connections), (7, 3))
+        self.assertEqual(client_stats()['clients_created'], 1)
+
+        reset_clients()
+        self.assertIsNot(get_openai_client(), client)
+
+    @skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_children_build_their_own_client(self):
+        parent_client = get_openai_client()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_end, b'1' if get_openai_client() is not parent_client else b'0')
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_end, 'rb') as f:
+            self.assertEqual(f.read(), b'1')
+        self.assertIs(get_openai_client(), parent_client)
+
+
+class BulkLookupTests(TestCase):
+    def setUp(self):
+        for name, calories in [('eba', 360), ('egusi soup', 593), ('white rice', 130), ('beans', 127)]:
+            Food.objects.create(name=name, calories_per_100g=calories, unit='g')
+        refresh_catalog()
+
+    def items(self, count):
+        names = ['eba', 'Egusi Soup', 'rice', 'beans', 'zobo', 'EBA']
+        return [{'food_name': names[i % len(names)], 'quantity': 1, 'unit': 'cup'} for i in range(count)]
+
+    def test_results_come_back_in_order(self):
+        results = lookup_foods_calories(self.items(6))
+        self.assertEqual(
+            [r.get('item') for r in results],
+            ['eba', 'egusi soup', 'white rice', 'beans', None, 'eba'],
+        )
+
+    @override_settings(FOOD_CATALOG_SNAPSHOT=False)
+    def test_query_count_does_not_grow_with_items(self):
+        # name__in for exact names, one for the fuzzy pass, one for portions
+        with self.assertNumQueries(3):
+            lookup_foods_calories(self.items(3))
+        with self.assertNumQueries(3):
+            lookup_foods_calories(self.items(30))
+
+    def test_snapshot_makes_no_queries(self):
+        with self.assertNumQueries(0):
+            lookup_foods_calories(self.items(30))
+
+
+class NutrientTests(TestCase):
+    def setUp(self):
+        Food.objects.create(
+            name='eba', calories_per_100g=360, unit='g', carbs_per_100g=87, fat_per_100g=0, fiber_per_100g=1.6
+        )
+        Food.objects.create(name='egusi soup', calories_per_100g=593, unit='g', protein_per_100g=20, fat_per_100g=50)
+        refresh_catalog()
+
+    def test_macros_are_scaled_per_item_and_totalled(self):
+        items, total = parse_food_log("1 plate eba, 100g egusi soup")
+        eba, soup = items
+        self.assertEqual(eba['total_calories'], 360 * eba['grams'] / 100)
+        self.assertEqual(eba['nutrients'], {
+            'protein_g': None, 'carbs_g': round(87 * eba['grams'] / 100, 2),
+            'fat_g': 0.0, 'fiber_g': round(1.6 * eba['grams'] / 100, 2),
+        })
+        self.assertEqual(soup['nutrients']['protein_g'], 20.0)
+        totals = total_nutrients(items)
+        # Unknown macros are left out, not counted as 0
+        self.assertEqual((totals['protein_g'], totals['fat_g']), (20.0, 50.0))
+        self.assertEqual(totals['carbs_g'], eba['nutrients']['carbs_g'])
+        self.assertIn('2 of 2 items', totals['note'])
+
+        totals = total_nutrients([eba])
+        self.assertIsNone(totals['protein_g'])
+        self.assertEqual(totals['fat_g'], 0.0)
+
+
+class UnitNormalizationTests(TestCase):
+    def test_units_and_quantities(self):
+        self.assertEqual(normalize_unit('Cups'), 'cup')
+        self.assertEqual(normalize_unit('tbsp.'), 'tbsp')
+        self.assertEqual(normalize_unit('small bowl'), 'bowl')
+        self.assertIsNone(normalize_unit('bag'))  # used to match 'g'
+        self.assertEqual(parse_quantity('1 1/2'), 1.5)
+        self.assertEqual(parse_quantity('twenty five'), 25)
+        self.assertEqual(parse_quantity('half a'), 0.5)
+        self.assertEqual(parse_quantity('¾'), 0.75)
+        self.assertTrue(is_single_quantity(['1', '1/2']) and is_single_quantity(['twenty', 'five']))
+        self.assertTrue(is_single_quantity(['half', 'a']))
+        self.assertFalse(is_single_quantity(['1', '2']) or is_single_quantity(['twenty', 'thirty']))
+
+    def test_food_specific_portions(self):
+        bread = Food.objects.create(name='white bread', calories_per_100g=266, unit='g')
+        FoodPortion.objects.create(food=bread, unit='slice', grams=30)
+        Food.objects.create(name='meat pie', calories_per_100g=300, unit='g')
+        refresh_catalog()
+
+        result = lookup_food_calories('white bread', 'two', 'slices')
+        self.assertEqual((result['grams'], result['total_calories']), (60, 159.6))
+        result = lookup_food_calories('meat pie', 1, 'piece')  # generic piece weight
+        self.assertEqual(result['grams'], 100)
+        result = lookup_food_calories('white bread', 200, 'g')
+        self.assertEqual(result['total_calories'], 532)
+
+
+class FoodLogTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        refresh_catalog()
+        self.user = User.objects.create_user(username='ada', password='pw')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def test_parse_log_updates_todays_rollup(self):
+        for text in ["1 cup eba", "2 cups eba"]:
+            response = self.client.post('/parse-log', {'foodLog': text}, content_type='application/json')
+            self.assertIsNotNone(response.json()['log_id'])
+
+        with self.assertNumQueries(2):  # user lookup for the JWT + one DailyTotal read
+            today = self.client.get('/me/today').json()
+        self.assertEqual(today['total_calories'], 360 * 2.4 * 3)
+        self.assertEqual((today['item_count'], today['log_count']), (2, 2))
+
+        days = self.client.get('/me/daily', {'start': '2000-01-01', 'end': '2000-01-03'}).json()['days']
+        self.assertEqual([d['total_calories'] for d in days], [0, 0, 0])
+
+    def test_multi_day_log_is_saved_under_its_days(self):
+        yesterday = (timezone.localdate() - timedelta(days=1)).isoformat()
+        log = "Yesterday\n1 cup eba\nMonday\n2 cups eba"
+        response = self.client.post('/parse-log', {'foodLog': log}, content_type='application/json').json()
+
+        self.assertEqual(self.client.get('/me/today').json()['total_calories'], 0)
+        days = self.client.get('/me/daily', {'start': yesterday, 'end': yesterday}).json()['days']
+        self.assertEqual((days[0]['total_calories'], days[0]['log_count']), (360 * 2.4, 1))
+        # "Monday" could be any week, so that day is kept but counted nowhere
+        undated = FoodLog.objects.get(logged_on__isnull=True)
+        self.assertEqual((undated.text, undated.total_calories), ("Monday\n2 cups eba", 360 * 2.4 * 2))
+        self.assertEqual([c['log_id'] for c in response['chunks']], [response['log_id'], undated.id])
+
+    def test_long_llm_units_are_clipped_to_fit(self):
+        item = {"item": "eba", "quantity": "2 " + "heaped serving spoons " * 5, "grams": 100, "total_calories": 360}
+        log = record_food_log(self.user, "eba", [item], 360)
+        quantity = log.items.get().quantity
+        self.assertEqual(len(quantity), FoodLogItem._meta.get_field('quantity').max_length)
+        self.assertTrue(quantity.startswith("2 heaped serving spoons"))
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, name, delay=0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def extract(self, log_text):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [{"food_name": "eba", "quantity": 1, "unit": "cup"}]
+
+
+@override_settings(LLM_BREAKER_FAILURES=2, LLM_BREAKER_RESET=60, LLM_DEADLINE=2)
+class LLMResilienceTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        Food.objects.create(name='egusi soup', calories_per_100g=593, unit='g')
+        refresh_catalog()
+        extraction_cache.memory.clear()
+
+    def test_open_breaker_falls_back_to_a_degraded_parse(self):
+        provider = FakeProvider('openai', error=RuntimeError('boom'))
+        with mock.patch('api.utils.llm_router', ProviderRouter([provider], explore=0)) as router:
+            for text in ["had some eba and egusi soup", "eba with egusi soup again"]:
+                parse_food_log(text)
+            self.assertEqual(router.guards['openai'].breaker.state, 'open')
+
+            items, total = parse_food_log("2 cups of eba dipped in egusi soup")
+        self.assertEqual(provider.calls, 2)  # the third parse never called it
+        self.assertEqual([(i['item'], i['source']) for i in items], [('eba', 'degraded'), ('egusi soup', 'degraded')])
+        self.assertEqual(items[0]['grams'], 480)
+
+    @override_settings(LLM_HEDGE=True, LLM_HEDGE_MIN_SAMPLES=1, LLM_HEDGE_MIN_DELAY=0.05)
+    def test_slow_call_is_hedged(self):
+        guard = GuardedCaller()
+        guard.latency.add(0.01)
+        calls = iter([0.5, 0])
+
+        def fake_llm(text):
+            time.sleep(next(calls))
+            return [{"food_name": "eba", "quantity": 1}]
+
+        self.assertEqual(guard.call(fake_llm, "x")[0]["food_name"], "eba")
+        self.assertEqual((guard.counters['hedges_sent'], guard.counters['hedge_wins']), (1, 1))
+
+    def test_a_cancelled_call_frees_the_breaker_trial(self):
+        guard = GuardedCaller()
+        guard.breaker.state = guard.breaker.HALF_OPEN
+
+        async def slow_llm(text):
+            await asyncio.sleep(5)
+
+        async def cancel_midway():
+            task = asyncio.ensure_future(guard.acall(slow_llm, "eba"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        async_to_sync(cancel_midway)()
+        self.assertEqual(guard.breaker.state, 'half_open')
+        self.assertTrue(guard.breaker.allow())
+
+    def test_an_unreported_trial_expires(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # the trial is still in flight
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+    @override_settings(LLM_DEADLINE=2)
+    def test_sdk_request_ends_at_the_deadline(self):
+        client = mock.Mock()
+        response = NS(choices=[NS(message=NS(content=None, tool_calls=[]))])
+        client.chat.completions.create.return_value = response
+        client.with_options.return_value.chat.completions.create.return_value = response
+        with mock.patch('api.providers.get_openai_client', return_value=client):
+            self.assertEqual(GuardedCaller().call(OpenAIProvider().extract, "eba"), [])
+            OpenAIProvider().extract("eba")  # outside a guard the client is used as is
+        timeout = client.with_options.call_args.kwargs['timeout']
+        self.assertTrue(0 < timeout <= 2)
+        self.assertEqual(client.with_options.call_args.kwargs['max_retries'], 0)
+        client.with_options.assert_called_once()
+        client.chat.completions.create.assert_called_once()
+
+
+@override_settings(LLM_BREAKER_FAILURES=100)
+class ProviderRouterTests(TestCase):
+    def test_requests_shift_to_the_faster_provider(self):
+        slow, fast = FakeProvider('slow', delay=0.03), FakeProvider('fast')
+        router = ProviderRouter([slow, fast], explore=0)
+        for _ in range(10):
+            self.assertEqual(router.extract("eba")[0]["food_name"], "eba")
+        # Each is tried once while unmeasured, then the fast one wins
+        self.assertEqual((slow.calls, fast.calls), (1, 9))
+
+    def test_failing_provider_falls_through_and_is_avoided(self):
+        broken, backup = FakeProvider('broken', error=RuntimeError('503')), FakeProvider('backup', delay=0.01)
+        router = ProviderRouter([broken, backup], explore=0)
+        for _ in range(5):
+            self.assertEqual(len(router.extract("eba")), 1)
+        self.assertEqual((broken.calls, backup.calls), (1, 5))
+        self.assertEqual(router.stats()['broken']['errors'], 1)
+
+    @override_settings(LLM_DEADLINE=0.2)
+    def test_fall_through_shares_one_deadline(self):
+        stalling = FakeProvider('stalling', delay=0.15, error=RuntimeError('502'))
+        backup = FakeProvider('backup', delay=0.1)
+        router = ProviderRouter([stalling, backup], explore=0)
+        start = time.monotonic()
+        with self.assertRaises(LLMDeadlineExceeded):
+            router.extract("eba")
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(backup.calls, 1)  # tried with what was left
+
+    def test_async_extraction_uses_the_same_router(self):
+        class AsyncFake(FakeProvider):
+            async def aextract(self, log_text):
+                return self.extract(log_text)
+
+        router = ProviderRouter([AsyncFake('a')], explore=0)
+        self.assertEqual(async_to_sync(router.aextract)("eba")[0]["unit"], "cup")
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        refresh_catalog()
+        user = User.objects.create_user(username='ada', password='pw')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+
+    def test_parse_is_reported_at_metrics(self):
+        before = request_queries.count(view='parse_log')
+        with mock.patch('api.utils.extract_with_llm', return_value=[{"food_name": "suya", "quantity": 1}]):
+            self.client.post('/parse-log', {'foodLog': "1 cup eba, then some suya"}, content_type='application/json')
+        self.assertEqual(request_queries.count(view='parse_log'), before + 1)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('parse_stage_seconds_count{stage="lookup"}', body)
+        self.assertIn('http_request_db_queries_bucket{view="parse_log",le="+Inf"}', body)
+        self.assertIn('parse_items_total{source="local"}', body)
+        self.assertIn('parse_unresolved_foods_bucket{le="1"}', body)  # suya isn't in the catalog
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_writes_results_and_fails_on_regression(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command('benchmark', sizes='60', iterations=10, output=output, stdout=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+            self.assertEqual(
+                set(report['results']['60']),
+                {'snapshot_build', 'fuzzy_index_build', 'matcher_build', 'suggest_index_build',
+                 'lookup_exact', 'lookup_fuzzy', 'lookup_miss', 'suggest', 'parse_food_log'},
+            )
+            self.assertFalse(Food.objects.exists())  # seeded foods were rolled back
+
+            report['results']['60']['lookup_exact']['median_us'] = 0.001
+            with open(output, 'w') as f:
+                json.dump(report, f)
+            with self.assertRaisesMessage(CommandError, '60/lookup_exact'):
+                call_command('benchmark', sizes='60', iterations=10, baseline=output, stdout=io.StringIO())
+
+
+class LoadTestStubTests(TestCase):
+    def test_stub_speaks_the_chat_completions_api(self):
+        from openai import OpenAI
+
+        calls = [{"food_name": "eba", "quantity": 2, "unit": "cup"}]
+        stub = LLMStub(calls, latency='fixed:0').start()
+        self.addCleanup(stub.stop)
+
+        client = OpenAI(api_key='x', base_url=stub.base_url, max_retries=0)
+        response = client.chat.completions.create(model='gpt-4o-mini', messages=[{"role": "user", "content": "2 cups eba"}])
+        self.assertEqual(tool_calls_to_args(response.choices[0].message), calls)
+        self.assertEqual(stub.calls, 1)
+
+    def test_latency_specs(self):
+        self.assertEqual(latency_sampler('fixed:0.25')(), 0.25)
+        self.assertTrue(0.1 <= latency_sampler('uniform:0.1:0.2')() <= 0.2)
+        with self.assertRaises(CommandError):
+            latency_sampler('gamma:1')
+
+
+@mock.patch.dict('os.environ', {'OPENAI_API_KEY': 'test'})
+class SingleFlightTests(TransactionTestCase):
+    def setUp(self):
+        extraction_cache.memory.clear()
+        self.calls = 0
+
+    def slow_llm(self, text):
+        self.calls += 1
+        time.sleep(0.2)
+        return [{"food_name": "eba", "quantity": self.calls}], 'openai:gpt-4o-mini'
+
+    def test_identical_concurrent_logs_share_one_call(self):
+        with mock.patch('api.utils.request_extraction', side_effect=self.slow_llm):
+            with ThreadPoolExecutor(max_workers=5) as pool:
+                results = list(pool.map(lambda _: extract_with_llm("viral meal plan"), range(5)))
+            self.assertEqual(self.calls, 1)
+            self.assertEqual(results, [[{"food_name": "eba", "quantity": 1}]] * 5)
+
+            # Once finished, nothing is held back: a new miss calls again
+            extraction_cache.memory.clear()
+            LLMExtraction.objects.all().delete()
+            extract_with_llm("viral meal plan")
+        self.assertEqual(self.calls, 2)
+
+    def test_waits_for_another_worker_and_reads_its_result(self):
+        key = cache_key("2 wraps shawarma", PROMPT_VERSION)
+        other_worker = KeyFileLock(extraction_locks.directory)
+
+        def finish_elsewhere():
+            with other_worker.hold(key):
+                started.set()
+                time.sleep(0.2)
+                extraction_cache.set(key, [{"food_name": "shawarma", "quantity": 2}], LLM_MODEL, PROMPT_VERSION)
+                extraction_cache.memory.clear()
+
+        started = threading.Event()
+        thread = threading.Thread(target=finish_elsewhere)
+        thread.start()
+        started.wait()
+        with mock.patch('api.utils.request_extraction', side_effect=self.slow_llm):
+            result = extract_with_llm("2 wraps shawarma")
+        thread.join()
+        self.assertEqual(result, [{"food_name": "shawarma", "quantity": 2}])
+        self.assertEqual(self.calls, 0)
+
+    def test_a_parse_joins_a_running_stream(self):
+        key = cache_key("viral meal plan", PROMPT_VERSION)
+        with mock.patch('api.utils.request_extraction', side_effect=self.slow_llm):
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                with singleflight.lead(key) as flight:
+                    follower = pool.submit(extract_with_llm, "viral meal plan")
+                    time.sleep(0.1)
+                    flight.set_result([{"food_name": "eba", "quantity": 4}])
+                self.assertEqual(follower.result(), [{"food_name": "eba", "quantity": 4}])
+        self.assertEqual(self.calls, 0)
+
+
+class ParseJobTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        refresh_catalog()
+        self.user = User.objects.create_user(username='ada', password='pw')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def test_async_parse_is_queued_then_done_by_a_worker(self):
+        response = self.client.post('/parse-log?async=1', {'foodLog': '2 cups eba'}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        self.assertEqual(self.client.get(f'/parse-log/jobs/{job_id}').json()['status'], 'pending')
+
+        call_command('parse_worker', processes=1, once=True, stdout=io.StringIO())
+
+        job = self.client.get(f'/parse-log/jobs/{job_id}', {'wait': 5}).json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['total_calories'], 360 * 4.8)
+        self.assertTrue(FoodLog.objects.filter(id=job['log_id'], user=self.user).exists())
+
+    def test_a_job_is_claimed_once(self):
+        job = enqueue_parse_job(self.user, 'eba')
+        self.assertEqual(claim_job('worker-a').id, job.id)
+        self.assertIsNone(claim_job('worker-b'))
+
+    def test_wait_must_be_a_finite_number(self):
+        job = enqueue_parse_job(self.user, 'eba')
+        for wait in ['nan', 'inf', '-inf', 'soon']:
+            self.assertEqual(self.client.get(f'/parse-log/jobs/{job.id}', {'wait': wait}).status_code, 400)
+        # Negative waits are clamped to 0 and answer right away
+        self.assertEqual(self.client.get(f'/parse-log/jobs/{job.id}', {'wait': -5}).json()['status'], 'pending')
+
+    def test_other_users_jobs_are_hidden(self):
+        job = enqueue_parse_job(User.objects.create_user(username='bola', password='pw'), 'eba')
+        self.assertEqual(self.client.get(f'/parse-log/jobs/{job.id}').status_code, 404)
+
+
+class MissingFoodTests(TestCase):
+    def setUp(self):
+        Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        refresh_catalog()
+        self.recorder = MissRecorder()
+        self.recorder._ensure_thread = lambda: None  # flushed by hand below
+
+    def test_unresolved_foods_and_units_are_counted_then_upserted(self):
+        extracted = [
+            ({'food_name': 'Zobo', 'quantity': 1, 'unit': 'cup'}, 'llm'),
+            ({'food_name': 'zobo', 'quantity': 2}, 'llm'),
+            ({'food_name': 'eba', 'quantity': 1, 'unit': 'smidgen'}, 'llm'),
+        ]
+        with mock.patch('api.utils.missing_foods', self.recorder):
+            items, _ = resolve_extracted(extracted)
+        self.assertEqual(len(items), 1)
+        self.assertEqual(self.recorder.pending(), {('food', 'zobo'): 2, ('unit', 'smidgen'): 1})
+
+        self.assertEqual(self.recorder.flush(), 2)
+        self.recorder.record_food('zobo')
+        self.recorder.flush()
+        self.assertEqual(self.recorder.pending(), {})
+        self.assertEqual(MissingFood.objects.get(kind='food', name='zobo').count, 3)
+
+        out = io.StringIO()
+        call_command('missing_foods', stdout=out)
+        self.assertIn('zobo', out.getvalue())
+        self.assertNotIn('smidgen', out.getvalue())
+
+
+class ImportFoodsCommandTests(TestCase):
+    def test_streams_and_upserts_valid_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.create(name='eba', calories_per_100g=100, unit='g')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("name,calories_per_100g,unit\nEba,360,g\nzobo,40,ml\n,12,g\nkunu,lots,ml\nzobo,45,ml\n")
+        self.addCleanup(os.remove, f.name)
+
+        out, err = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_foods', f.name, chunk_size=2, stdout=out, stderr=err)
+
+        self.assertEqual(dict(Food.objects.values_list('name', 'calories_per_100g')), {'eba': 360, 'zobo': 45})
+        self.assertIn('(2 invalid)', out.getvalue())
+        self.assertIn('line 4: missing name', err.getvalue())
+        self.assertEqual(get_catalog().get('zobo').calories_per_100g, 45)
+
+    def test_only_macro_columns_in_the_file_are_updated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.create(name='eba', calories_per_100g=100, unit='g', protein_per_100g=1.5, fat_per_100g=0.5)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"name": "eba", "calories_per_100g": 360, "fat": ""}\n')
+            f.write('{"name": "zobo", "calories_per_100g": 40, "carbs_per_100g": 9}\n')
+        self.addCleanup(os.remove, f.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_foods', f.name, stdout=io.StringIO())
+
+        eba = Food.objects.get(name='eba')
+        self.assertEqual((eba.calories_per_100g, eba.protein_per_100g, eba.fat_per_100g), (360, 1.5, None))
+        zobo = Food.objects.get(name='zobo')
+        self.assertEqual((zobo.carbs_per_100g, zobo.protein_per_100g), (9, None))
+
+
+class CatalogVersionTests(TestCase):
+    def test_foods_endpoint_revalidates_with_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.create(name='eba', calories_per_100g=360, unit='g')
+        response = self.client.get('/foods')
+        self.assertEqual(response.json()['foods'][0]['name'], 'eba')
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get('/foods', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.filter(name='eba').update(calories_per_100g=350)
+            invalidate_catalog()
+        response = self.client.get('/foods', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_a_transaction_bumps_the_version_once(self):
+        counter = CatalogVersion.objects.get_or_create(pk=1)[0].counter
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                for name in ['eba', 'amala', 'fufu']:
+                    Food.objects.create(name=name, calories_per_100g=300, unit='g')
+                try:
+                    with transaction.atomic():
+                        Food.objects.create(name='zobo', calories_per_100g=40, unit='ml')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                invalidate_catalog()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(CatalogVersion.objects.get().counter, counter + 1)
+
+    def test_populate_foods_is_a_no_op_when_nothing_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('populate_foods', stdout=io.StringIO())
+        counter = CatalogVersion.objects.get().counter
+
+        out = io.StringIO()
+        call_command('populate_foods', stdout=out)
+        self.assertIn('nothing to do', out.getvalue())
+        self.assertEqual(CatalogVersion.objects.get().counter, counter)
+
+        # A change made elsewhere means the next deploy writes the foods again
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.filter(name='eba').update(calories_per_100g=1)
+            invalidate_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('populate_foods', stdout=io.StringIO())
+        self.assertEqual(Food.objects.get(name='eba').calories_per_100g, 360)
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='ada', password='pw')
+        for name in ['jollof rice', 'white rice', 'rice flour', 'egusi soup']:
+            Food.objects.create(name=name, calories_per_100g=130, unit='g')
+        with self.captureOnCommitCallbacks(execute=True):
+            record_food_log(user, 'log', [
+                {"item": "white rice", "quantity": "1 plate", "grams": 100, "total_calories": 130}
+            ] * 3 + [{"item": "jollof rice", "quantity": "1 plate", "grams": 100, "total_calories": 130}], 520)
+        refresh_catalog()
+
+    def test_word_prefixes_ranked_by_popularity_without_queries(self):
+        get_catalog().suggest_index
+        with self.assertNumQueries(0):
+            response = self.client.get('/foods/suggest', {'q': 'Ri'})
+        names = [s['name'] for s in response.json()['suggestions']]
+        self.assertEqual(names, ['white rice', 'jollof rice', 'rice flour'])
+
+        search = get_catalog().suggest_index.search
+        self.assertEqual([e.name for e in search('jollof r')], ['jollof rice'])
+        self.assertEqual([e.name for e in search('rice f', limit=1)], ['rice flour'])
+        self.assertEqual(search('zobo'), [])
+
+    def test_logging_counts_towards_popularity(self):
+        self.assertEqual(Food.objects.get(name='white rice').times_logged, 3)
+        user = User.objects.get(username='ada')
+        record_food_log(user, 'log', [
+            {"item": "rice flour", "quantity": "1 cup", "grams": 100, "total_calories": 360},
+        ] * 4, 1440)
+        refresh_catalog()
+        names = [s['name'] for s in self.client.get('/foods/suggest', {'q': 'ri'}).json()['suggestions']]
+        self.assertEqual(names, ['rice flour', 'white rice', 'jollof rice'])
+
+
+class CatalogIndexTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bread = Food.objects.create(name='white bread', calories_per_100g=266, unit='g', carbs_per_100g=49)
+            FoodPortion.objects.create(food=bread, unit='slice', grams=30)
+            Food.objects.create(name='açaí bowl', calories_per_100g=70, unit='g')
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'catalog.idx')
+        call_command('build_catalog_index', output=self.path, stdout=io.StringIO())
+
+    def test_workers_look_foods_up_in_the_mapped_file(self):
+        with override_settings(FOOD_CATALOG_INDEX_PATH=self.path):
+            catalog = get_catalog()
+            self.assertEqual(type(catalog).__name__, 'MappedCatalog')
+            self.assertEqual(catalog.get('Açaí  Bowl').calories_per_100g, 70)
+            self.assertIsNone(catalog.get('brown bread'))
+            with self.assertNumQueries(0):
+                result = lookup_food_calories('white bread', 'two', 'slices')
+            self.assertEqual((result['grams'], result['total_calories']), (60, 159.6))
+            self.assertEqual(result['nutrients']['carbs_g'], 29.4)
+
+        with override_settings(FOOD_CATALOG_INDEX_PATH=self.path + '.missing'):
+            self.assertEqual(type(get_catalog()).__name__, 'CatalogSnapshot')
+
+    def test_rebuild_is_skipped_until_the_catalog_changes(self):
+        out = io.StringIO()
+        call_command('build_catalog_index', output=self.path, stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Food.objects.create(name='brown bread', calories_per_100g=250, unit='g')
+            invalidate_catalog()
+        call_command('build_catalog_index', output=self.path, stdout=io.StringIO())
+        with override_settings(FOOD_CATALOG_INDEX_PATH=self.path), mock.patch('api.catalog_index.RECHECK_SECONDS', 0):
+            self.assertEqual(get_catalog().get('brown bread').calories_per_100g, 250)
@@ -0,0 +1,48 @@
+"""
+Per-request stage timings, reported in the Server-Timing response header.
+
+A context variable holds the timings of the current request, so it works the
+same for sync views, async views and nested calls without passing a dict
+around. Every timed() stage is also observed in the parse_stage_seconds
+histogram (api.metrics).
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from api.metrics import stage_seconds
+
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Collect timings recorded while the block runs; yields the dict."""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def record_timing(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + seconds
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        record_timing(name, seconds)
+        stage_seconds.observe(seconds, stage=name)
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
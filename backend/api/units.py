@@ -0,0 +1,189 @@
+"""
+Unit and quantity normalization.
+
+Everything here is compiled once at import: every spelling of every unit
+(plurals, abbreviations) maps straight to a canonical unit in one dict, so
+normalizing an item is a couple of dict lookups instead of the old
+order-dependent substring scan (which let 'g' match inside "mug").
+"""
+
+import re
+from fractions import Fraction
+
+# Grams (or ml, treated as grams) in one canonical unit.
+UNIT_GRAMS = {
+    'g': 1,
+    'mg': 0.001,
+    'kg': 1000,
+    'ml': 1,
+    'cl': 10,
+    'l': 1000,
+    'oz': 28.35,
+    'lb': 453.59,
+    'tsp': 5,
+    'tbsp': 15,
+    'cup': 240,
+    'plate': 250,
+    'bowl': 350,
+    'derica': 450,  # Approximate grams in a derica cup
+    'gallon': 3785.41,
+}
+
+# Count units whose weight depends on the food. These are fallbacks for when
+# a food has no FoodPortion row for the unit.
+DEFAULT_PORTION_GRAMS = {
+    'piece': 100,
+    'slice': 30,
+    'ball': 40,
+    'wrap': 150,
+    'stick': 50,
+    'serving': 100,
+}
+
+# Other spellings (plurals, abbreviations) of each canonical unit.
+_ALIASES = {
+    'g': ['gram', 'grams', 'gramme', 'grammes', 'gm', 'gms', 'gr'],
+    'mg': ['milligram', 'milligrams'],
+    'kg': ['kilogram', 'kilograms', 'kilo', 'kilos', 'kgs'],
+    'ml': ['millilitre', 'millilitres', 'milliliter', 'milliliters', 'mls'],
+    'cl': ['centilitre', 'centilitres', 'centiliter', 'centiliters'],
+    'l': ['litre', 'litres', 'liter', 'liters', 'ltr', 'lt'],
+    'oz': ['ounce', 'ounces'],
+    'lb': ['pound', 'pounds', 'lbs'],
+    'tsp': ['teaspoon', 'teaspoons', 'tsps'],
+    'tbsp': ['tablespoon', 'tablespoons', 'tbsps', 'tbs', 'tbl'],
+    'cup': ['cups', 'mug', 'mugs'],
+    'plate': ['plates', 'plateful', 'platefuls'],
+    'bowl': ['bowls', 'bowlful', 'bowlfuls'],
+    'derica': ['dericas'],
+    'gallon': ['gallons'],
+    'piece': ['pieces', 'pc', 'pcs', 'pce'],
+    'slice': ['slices'],
+    'ball': ['balls'],
+    'wrap': ['wraps'],
+    'stick': ['sticks', 'skewer', 'skewers'],
+    'serving': ['servings', 'portion', 'portions'],
+}
+
+
+def _build_unit_lookup():
+    lookup = {}
+    for canonical in list(UNIT_GRAMS) + list(DEFAULT_PORTION_GRAMS):
+        lookup[canonical] = canonical
+        for alias in _ALIASES.get(canonical, []):
+            lookup[alias] = canonical
+    return lookup
+
+
+UNIT_LOOKUP = _build_unit_lookup()
+
+NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+    'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15,
+    'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19,
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50,
+    'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90,
+    'a': 1, 'an': 1, 'single': 1, 'couple': 2, 'dozen': 12,
+    'half': 0.5, 'quarter': 0.25, 'third': Fraction(1, 3),
+}
+
+UNICODE_FRACTIONS = {
+    '½': Fraction(1, 2), '⅓': Fraction(1, 3), '⅔': Fraction(2, 3),
+    '¼': Fraction(1, 4), '¾': Fraction(3, 4), '⅛': Fraction(1, 8),
+}
+
+QUANTITY_TOKEN_RE = re.compile(r'\d+/\d+|\d+(?:\.\d+)?|[½⅓⅔¼¾⅛]|[a-z]+')
+TENS_WORDS = {'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety'}
+ONES_WORDS = {'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine'}
+FRACTION_TOKEN_RE = re.compile(r'\d+/\d+|[½⅓⅔¼¾⅛]')
+
+
+def is_single_quantity(tokens):
+    """
+    Whether adjacent quantity tokens spell one amount.
+
+    That's a single token, a mixed number ("1 1/2", "1½"), a compound number
+    word ("twenty five"), or one of those with an article ("half a"). Other
+    runs are ranges or several numbers ("1-2", "100 200g", "2 3"), which
+    parse_quantity() would add up, so callers leave them to the LLM.
+    """
+    tokens = [t for t in tokens if t not in ('a', 'an')] if len(tokens) > 1 else list(tokens)
+    if len(tokens) < 2:
+        return bool(tokens)
+    if len(tokens) > 2:
+        return False
+    whole, part = tokens
+    return (whole.isdigit() and bool(FRACTION_TOKEN_RE.fullmatch(part))) or (
+        whole in TENS_WORDS and part in ONES_WORDS
+    )
+
+
+def parse_quantity(text):
+    """
+    Parse '2', '1.5', '1/2', '1 1/2', '1½', 'two', 'twenty five', 'a', 'half'.
+
+    Parts are added together, so "1 1/2" is 1.5 and "twenty five" is 25.
+    Returns a float, or None if any part isn't a number.
+    """
+    if isinstance(text, (int, float)):
+        return float(text)
+    total = Fraction(0)
+    tokens = QUANTITY_TOKEN_RE.findall(str(text).lower())
+    if not tokens:
+        return None
+    if len(tokens) > 1:
+        # "a half", "a dozen": the article isn't an extra one
+        tokens = [t for t in tokens if t not in ('a', 'an')]
+    for token in tokens:
+        if token in NUMBER_WORDS:
+            total += Fraction(NUMBER_WORDS[token])
+        elif token in UNICODE_FRACTIONS:
+            total += UNICODE_FRACTIONS[token]
+        else:
+            try:
+                total += Fraction(token)
+            except (ValueError, ZeroDivisionError):
+                return None
+    return float(total)
+
+
+def normalize_unit(text):
+    """
+    Canonical unit for free text like 'Cups', 'tbsp.', 'large plate'.
+
+    The whole string is tried first, then each word from the right, so
+    'small bowl' is a bowl. Returns None if no word is a known unit.
+    """
+    if not text:
+        return None
+    text = text.lower().strip().rstrip('.')
+    if text in UNIT_LOOKUP:
+        return UNIT_LOOKUP[text]
+    for word in reversed(re.findall(r'[a-z]+', text)):
+        if word in UNIT_LOOKUP:
+            return UNIT_LOOKUP[word]
+    return None
+
+
+def grams_for(food_id, quantity, unit, portions):
+    """
+    Weight in grams of `quantity` `unit`s of a food.
+
+    `portions` maps (food_id, unit) to grams for food-specific units such as a
+    slice of bread. With no (recognised) unit the quantity counts in 100 g
+    servings, matching how calories_per_100g was always applied.
+
+    Returns (grams, canonical_unit or None).
+    """
+    quantity = parse_quantity(quantity)
+    if quantity is None:
+        raise ValueError("quantity is not a number")
+    canonical = normalize_unit(unit)
+    if canonical is None:
+        return quantity * 100, None
+
+    per_unit = portions.get((food_id, canonical))
+    if per_unit is None:
+        per_unit = UNIT_GRAMS.get(canonical) or DEFAULT_PORTION_GRAMS[canonical]
+    return quantity * per_unit, canonical
@@ -1,8 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+from . import async_views
+
+# Under an ASGI server the async view serves /parse-log (see DEPLOY.md)
+parse_log_view = async_views.parse_log_async if settings.ASYNC_PARSE_LOG else views.parse_log
 
 urlpatterns = [
-    path('parse-log', views.parse_log, name='parse_log'),
+    path('parse-log', parse_log_view, name='parse_log'),
+    path('parse-log/stream', views.parse_log_stream, name='parse_log_stream'),
+    path('parse-log/batch', views.parse_log_batch, name='parse_log_batch'),
+    path('parse-log/jobs/<int:job_id>', async_views.parse_job_status, name='parse_job_status'),
+    path('foods', views.list_foods, name='foods'),
+    path('foods/suggest', views.suggest_foods, name='suggest_foods'),
     path('register', views.register, name='register'),
     path('me', views.get_me, name='me'),
+    path('me/today', views.get_today, name='me_today'),
+    path('me/daily', views.get_daily, name='me_daily'),
+    path('stats', views.parse_stats, name='parse_stats'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,163 +1,774 @@
+import contextvars
+import logging
+import math
 import os
-from google import genai
-from google.genai import types
-from api.models import Food
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from api.catalog import get_catalog, normalize_name
+from api.fuzzy import best_matches
+from api.llm_cache import cache_key, extraction_cache
+from api.llm_clients import get_openai_client
+from api.metrics import llm_tool_calls, observe_parse
+from api.misses import missing_foods
+from api.prompts import LLM_MODEL, LOOKUP_TOOL, PROMPT_VERSION, build_llm_messages, tool_call_to_args
+from api.providers import llm_router
+from api.resilience import CircuitOpenError, LLMDeadlineExceeded
+from api.singleflight import extraction_locks, singleflight
+from api.timing import timed
+from api.units import QUANTITY_TOKEN_RE, grams_for, is_single_quantity, normalize_unit, parse_quantity
 from dotenv import load_dotenv
 
 
 
-# A simple "database" for text-to-number conversion.
-NUMBER_WORDS = {
-    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
-    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
-}
+load_dotenv()
 
-# A simple "database" for unit conversion (in ml for liquid, g for solid).
-UNITS = {
-    'gallon': 3785.41,
-    'cup': 240,
-    'plate': 250,
-    'bowl': 350,
-    'derica': 450,  # Approximate grams in a derica cup
-    'g': 1,
-    'gram': 1,
-    'grams': 1,
-    'ml': 1,
-}
+logger = logging.getLogger(__name__)
 
-load_dotenv()
+# Keys of an item's "nutrients", matching catalog.MACRO_FIELDS
+NUTRIENT_KEYS = ('protein_g', 'carbs_g', 'fat_g', 'fiber_g')
 
-def lookup_food_calories(food_name: str, quantity: float, unit: str = None) -> dict:
+def lookup_food_calories(food_name: str, quantity: float, unit: str = None, catalog=None) -> dict:
     """
-    Calculates calories for a specific food item by querying the database.
+    Calculates calories for a specific food item using the in-memory catalog.
     
     Args:
         food_name: The name of the food (e.g., 'eba', 'rice').
         quantity: The amount eaten.
         unit: The unit of measurement (e.g., 'cup', 'gram', 'plate').
+        catalog: Snapshot to read from; defaults to the current one.
     
     Returns:
         Dictionary with calorie details or error.
     """
+    item = {"food_name": food_name, "quantity": quantity, "unit": unit}
+    return lookup_foods_calories([item], catalog)[0]
+
+
+def lookup_foods_calories(items, catalog=None):
+    """
+    Batch version of lookup_food_calories() for every item of a parse at once.
+    
+    Exact names are resolved together (a single name__in query when the
+    catalog isn't held in memory) and the misses go through one fuzzy pass,
+    so the number of queries doesn't grow with the number of items.
+    
+    Args:
+        items: Dicts with food_name, quantity and optional unit.
+        catalog: Snapshot to read from; defaults to the current one.
+    
+    Returns:
+        One result dict per item, in the same order.
+    """
+    catalog = catalog or get_catalog()
+    
     # Normalize input
-    food_name = food_name.lower().strip()
+    names = [normalize_name(item.get("food_name") or "") for item in items]
     
-    # Try exact match first
-    try:
-        food = Food.objects.get(name=food_name)
-    except Food.DoesNotExist:
-        # Fall back to fuzzy match (partial matching)
-        food = Food.objects.filter(name__icontains=food_name).first()
+    # Try exact matches first
+    foods = catalog.get_many(name for name in names if name)
+    # Fall back to the closest name by trigram similarity
+    misses = [name for name in names if name and name not in foods]
+    fuzzy = best_matches(catalog, misses) if misses else {}
     
-    if not food:
-        return {"error": f"Food '{food_name}' not found in database."}
-        
-    # Get base calories (per 100g/ml)
-    calories_per_100g = food.calories_per_100g
-    
-    # Calculate Unit Factor
-    unit_factor = 1.0 # Default to 100g if no unit
-    if unit:
-        unit = unit.lower().strip()
-        # Check exact match first
-        if unit in UNITS:
-            unit_factor = UNITS[unit] / 100
-        else:
-            # Check partial match
-            for u_key, u_val in UNITS.items():
-                if u_key in unit:
-                    unit_factor = u_val / 100
-                    break
-    
-    total_calories = calories_per_100g * quantity * unit_factor
-    
-    return {
-        "item": food.name,
-        "quantity": f"{quantity} {unit if unit else 'g'}",
-        "total_calories": round(total_calories, 2),
-        "calories_today": round(total_calories, 2) # Assuming full portion for now, can add fraction logic later
+    # Food-specific unit weights (a slice of bread, a piece of chicken)
+    portions = catalog.portions_for(
+        [food.id for food in foods.values()] + [food.id for food, _ in fuzzy.values()]
+    )
+    
+    results = []
+    resolved = []  # (result index, food, grams)
+    for item, name in zip(items, names):
+        food, match_score = foods.get(name), None
+        if food is None and name in fuzzy:
+            food, match_score = fuzzy[name]
+        if not food:
+            results.append({"error": f"Food '{name}' not found in database.", "missing": name})
+            continue
+        try:
+            grams, canonical_unit = grams_for(food.id, item.get("quantity"), item.get("unit"), portions)
+        except (TypeError, ValueError) as e:
+            results.append({"error": f"Invalid quantity for '{name}': {e}"})
+            continue
+        unit = item.get("unit")
+        result = {
+            "item": food.name,
+            "quantity": f"{item.get('quantity')} {canonical_unit or (unit.lower().strip() if unit else 'g')}",
+            "grams": round(grams, 1),
+        }
+        if match_score is not None:
+            result["match_score"] = round(match_score, 3)
+        resolved.append((len(results), food, grams))
+        results.append(result)
+
+    if resolved:
+        # Calories and macros of every item in one go: per-100 g rows scaled by grams
+        grams = np.array([g for _, _, g in resolved], dtype=np.float64)
+        amounts = catalog.nutrients_for([food for _, food, _ in resolved])
+        amounts *= grams[:, None]
+        amounts /= 100
+        for (index, _, _), row in zip(resolved, amounts.round(2).tolist()):
+            results[index].update(
+                total_calories=row[0],
+                calories_today=row[0],  # Assuming full portion for now, can add fraction logic later
+                # Unknown macros (NaN) are reported as null, never as 0
+                nutrients={key: None if math.isnan(value) else value for key, value in zip(NUTRIENT_KEYS, row[1:])},
+            )
+    return results
+
+
+def total_nutrients(parsed_items):
+    """
+    Macros of a whole parse (grams), summed over its items.
+
+    Items without data for a macro are left out of that total rather than
+    counted as 0; a total is null when no item had data for it, and "note"
+    says how many items were left out.
+    """
+    if not parsed_items:
+        return dict.fromkeys(NUTRIENT_KEYS, 0)
+    values = np.array(
+        [[item["nutrients"][key] for key in NUTRIENT_KEYS] for item in parsed_items], dtype=np.float64
+    )
+    unknown = np.isnan(values)
+    totals = np.nansum(values, axis=0).round(2).tolist()
+    result = {
+        key: None if unknown[:, i].all() else totals[i] for i, key in enumerate(NUTRIENT_KEYS)
     }
+    incomplete = int(unknown.any(axis=1).sum())
+    if incomplete:
+        result["note"] = (
+            f"{incomplete} of {len(parsed_items)} items have no data for some macros "
+            "and are left out of those totals."
+        )
+    return result
 
-def parse_food_log(log_text):
+# --- Local fast path ---
+# Trivial logs ("2 cups eba, 1 plate egusi soup") don't need an LLM. Each
+# segment is parsed with the rules from the old Flask backend; only segments
+# that can't be resolved completely are sent to OpenAI.
+
+SEGMENT_SPLIT_RE = re.compile(r'\n|,|;| and | with ', re.IGNORECASE)
+TOKEN_RE = QUANTITY_TOKEN_RE
+# Words that can sit around a food without changing what was eaten
+FILLER_WORDS = {'of', 'the', 'i', 'ate', 'had'}
+
+
+def split_log_segments(log_text):
     """
-    Uses OpenAI to parse the food log and call the lookup tool.
+    Split a log into one candidate food entry per segment, as the user wrote it.
+
+    Only known day and meal labels are dropped: "eba: 2 cups" names the food
+    before the colon, so a generic "word:" prefix can't be thrown away.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        print("DEBUG: No OPENAI_API_KEY found!")
-        return [], 0
-        
-    from openai import OpenAI
-    client = OpenAI(api_key=api_key)
-    
-    # Define the tool in OpenAI format
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "lookup_food_calories",
-                "description": "Calculates calories for a specific food item",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "food_name": {
-                            "type": "string",
-                            "description": "The name of the food (e.g., 'eba', 'rice')"
-                        },
-                        "quantity": {
-                            "type": "number",
-                            "description": "The amount eaten"
-                        },
-                        "unit": {
-                            "type": "string",
-                            "description": "The unit of measurement (e.g., 'cup', 'gram', 'plate')"
-                        }
-                    },
-                    "required": ["food_name", "quantity"]
-                }
-            }
-        }
-    ]
+    segments = []
+    for segment in SEGMENT_SPLIT_RE.split(log_text):
+        # Day and meal headers ("Monday", "Day 2 -", "Lunch:") aren't food;
+        # left in, each would cost an LLM call
+        for header_re in (DAY_HEADER_RE, MEAL_HEADER_RE):
+            header = header_re.match(segment)
+            if header:
+                segment = segment[header.end():].lstrip(' :-')
+        segment = segment.strip()
+        if segment:
+            segments.append(segment)
+    return segments
+
+
+def _quantity_and_unit(text):
+    """
+    (quantity tokens, unit) written on one side of a food, or None when a
+    word there is neither a number, a unit nor filler.
+    """
+    # The quantity may span several adjacent tokens ("1 1/2", "twenty five")
+    quantity_tokens = []
+    quantity_done = False
+    unit = None
+    for token in TOKEN_RE.findall(text):
+        if not quantity_done and parse_quantity(token) is not None:
+            quantity_tokens.append(token)
+            continue
+        quantity_done = bool(quantity_tokens)
+        if unit is None and normalize_unit(token):
+            unit = normalize_unit(token)
+        elif token not in FILLER_WORDS:
+            return None
+    return quantity_tokens, unit
+
+
+def parse_segment_locally(segment, catalog):
+    """
+    Resolve one segment to a list of lookup_food_calories() arguments, or
+    return None.
+
+    A segment only counts as resolved when every food in it is a catalog
+    food with a quantity, and every other word is a unit or filler. A food's
+    quantity is the one written before it (since the previous food), so in
+    "2 eba 3 rice" the 3 is rice's; only the last food may take a quantity
+    written after it ("eba 2 cups"), and one on both sides ("2 eba 3") is
+    left for the LLM rather than guessed, as are ranges and other runs of
+    numbers ("1-2 cups", see is_single_quantity()). Anything else is left for
+    the LLM.
+    """
+    text = ' '.join(segment.lower().split())
+    matches = catalog.matcher.find(text)
+    if not matches:
+        return None
+
+    resolved = []
+    previous_end = 0
+    for index, (start, end, food_name) in enumerate(matches):
+        before = _quantity_and_unit(text[previous_end:start])
+        if before is None:
+            return None
+        quantity_tokens, unit = before
+        if index == len(matches) - 1:
+            after = _quantity_and_unit(text[end:])
+            if after is None or (quantity_tokens and after[0]) or (unit and after[1]):
+                return None
+            quantity_tokens = quantity_tokens or after[0]
+            unit = unit or after[1]
+        if not is_single_quantity(quantity_tokens):
+            return None
+        quantity = parse_quantity(' '.join(quantity_tokens))
+        resolved.append({"food_name": food_name, "quantity": quantity, "unit": unit})
+        previous_end = end
+    return resolved
+
+
+def parse_log_locally(log_text, catalog=None):
+    """
+    Run the rule-based parser over every segment of a log.
+
+    Returns (resolved, unresolved): a list of lookup argument dicts and the
+    list of segments that still need the LLM.
+    """
+    catalog = catalog or get_catalog()
+    if catalog.matcher is None:
+        # No in-memory catalog to match against; everything goes to the LLM
+        return [], [log_text]
+    resolved = []
+    unresolved = []
+    for segment in split_log_segments(log_text):
+        items = parse_segment_locally(segment, catalog)
+        if items:
+            resolved += items
+        else:
+            unresolved.append(segment)
+    return resolved, unresolved
+
+
+def parse_segments_degraded(segments, catalog):
+    """
+    Best-effort parse used when the LLM is unavailable.
+
+    Every catalog food found in a segment is kept, with the quantity and unit
+    written just before it when there are any and 1 (x100g) otherwise.
+    """
+    if catalog.matcher is None:
+        return []
+    items = []
+    for segment in segments:
+        text = ' '.join(segment.lower().split())
+        previous_end = 0
+        for start, end, food_name in catalog.matcher.find(text):
+            quantity_tokens = []
+            unit = None
+            for token in TOKEN_RE.findall(text[previous_end:start]):
+                if parse_quantity(token) is not None:
+                    quantity_tokens.append(token)
+                elif normalize_unit(token):
+                    unit = normalize_unit(token)
+            quantity = parse_quantity(' '.join(quantity_tokens)) if quantity_tokens else 1
+            items.append({"food_name": food_name, "quantity": quantity, "unit": unit})
+            previous_end = end
+    return items
+
+
+def request_extraction(log_text):
+    """
+    Ask an LLM to extract food items from the text.
+
+    The provider (OpenAI or Gemini) is picked by api.providers.llm_router.
+    Returns (lookup_food_calories() argument dicts, "provider:model" that
+    answered). Errors propagate to the caller.
+    """
+    return llm_router.answer(log_text)
+
+
+async def arequest_extraction(log_text):
+    """Async version of request_extraction()."""
+    return await llm_router.aanswer(log_text)
+
+
+def extract_with_llm(log_text, raise_errors=False):
+    """
+    Cached wrapper around request_extraction(); the router applies the
+    per-provider deadline, hedging and circuit breakers.
+
+    Returns None when no LLM can be used (no API key, breakers open, or the
+    call failed), so the caller can fall back to a degraded local parse.
+    Failed calls are not cached; with raise_errors they propagate instead.
+    """
+    if not llm_router.available():
+        logger.warning("No LLM provider configured (OPENAI_API_KEY / GEMINI_API_KEY)")
+        return None
+    
+    key = cache_key(log_text, PROMPT_VERSION)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    try:
+        with timed("llm"):
+            # Identical logs already being extracted share that call
+            return singleflight.do(key, lambda: _extract_and_store(key, log_text))
+    except CircuitOpenError:
+        logger.warning("Every LLM circuit breaker is open, skipping call")
+        return None
+    except Exception as e:
+        logger.error("LLM extraction failed", extra={"error": str(e)})
+        if raise_errors:
+            raise
+        return None
+
+
+def _extract_and_store(key, log_text):
+    with extraction_locks.hold(key) as waited:
+        if waited:
+            # Another worker had the lock, so it has probably just cached this
+            cached = extraction_cache.get(key)
+            if cached is not None:
+                return cached
+        extracted, model = request_extraction(log_text)
+        llm_tool_calls.observe(len(extracted))
+        extraction_cache.set(key, extracted, model, PROMPT_VERSION)
+        return extracted
+
+
+async def aextract_with_llm(log_text):
+    """Async version of extract_with_llm()."""
+    if not llm_router.available():
+        logger.warning("No LLM provider configured (OPENAI_API_KEY / GEMINI_API_KEY)")
+        return None
     
+    key = cache_key(log_text, PROMPT_VERSION)
+    cached = await extraction_cache.aget(key)
+    if cached is not None:
+        return cached
+    
+    try:
+        with timed("llm"):
+            return await singleflight.ado(key, lambda: _aextract_and_store(key, log_text))
+    except CircuitOpenError:
+        logger.warning("Every LLM circuit breaker is open, skipping call")
+        return None
+    except Exception as e:
+        logger.error("LLM extraction failed", extra={"error": str(e)})
+        return None
+
+
+async def _aextract_and_store(key, log_text):
+    async with extraction_locks.ahold(key) as waited:
+        if waited:
+            cached = await extraction_cache.aget(key)
+            if cached is not None:
+                return cached
+        extracted, model = await arequest_extraction(log_text)
+        llm_tool_calls.observe(len(extracted))
+        await extraction_cache.aset(key, extracted, model, PROMPT_VERSION)
+        return extracted
+
+
+def resolve_extracted(extracted, catalog=None):
+    """
+    Look up calories for (args, source) pairs from the local parser or LLM.
+
+    Returns (parsed_items, total_calories); unknown foods are dropped.
+    """
+    with timed("lookup"):
+        results = lookup_foods_calories([args for args, _ in extracted], catalog)
+    return collect_items(extracted, results)
+
+
+def collect_items(extracted, results):
+    """Pair lookup results with their source and total them up."""
     parsed_items = []
     total_calories = 0
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a nutrition assistant. Extract food items, quantities, and units from the user's text. Call the 'lookup_food_calories' function for EACH food item found."},
-                {"role": "user", "content": log_text}
-            ],
-            tools=tools,
-            tool_choice="auto"
-        )
-        
-        message = response.choices[0].message
-        
-        print(f"DEBUG: OpenAI Response: {message.content}")
+    for (args, source), result in zip(extracted, results):
+        logger.debug("Tool result", extra={"result": result})
         
-        # Check if there are tool calls
-        if message.tool_calls:
-            print(f"DEBUG: Function calls found: {len(message.tool_calls)}")
-            for tool_call in message.tool_calls:
-                print(f"DEBUG: Calling tool: {tool_call.function.name} with args: {tool_call.function.arguments}")
-                if tool_call.function.name == 'lookup_food_calories':
-                    import json
-                    args = json.loads(tool_call.function.arguments)
-                    result = lookup_food_calories(
-                        food_name=args.get('food_name'),
-                        quantity=args.get('quantity'),
-                        unit=args.get('unit')
-                    )
-                    print(f"DEBUG: Tool Result: {result}")
-                    
-                    if 'error' not in result:
-                        parsed_items.append(result)
-                        total_calories += result['total_calories']
-                        
-    except Exception as e:
-        print(f"OpenAI Error: {e}")
-        pass
+        if 'error' not in result:
+            result["source"] = source
+            parsed_items.append(result)
+            total_calories += result['total_calories']
+            if args.get("unit") and normalize_unit(args["unit"]) is None:
+                missing_foods.record_unit(args["unit"])
+        elif result.get("missing"):
+            # Counted in memory, written to MissingFood in the background
+            missing_foods.record_food(result["missing"])
 
     return parsed_items, round(total_calories, 2)
+
+
+def parse_food_log(log_text):
+    """
+    Parses the food log, locally where possible and with OpenAI otherwise.
+
+    Each parsed item carries a "source" saying which path resolved it:
+    "local", "llm", or "degraded" when the LLM was unavailable and the
+    leftovers were parsed leniently instead.
+    """
+    catalog = get_catalog()
+    local_items, unresolved = parse_log_locally(log_text, catalog)
+    
+    extracted = [(args, "local") for args in local_items]
+    if unresolved:
+        # Only the leftovers go to the LLM, one segment per line
+        llm_items = extract_with_llm("\n".join(unresolved))
+        extracted += llm_or_degraded(llm_items, unresolved, catalog)
+    
+    parsed_items, total_calories = resolve_extracted(extracted, catalog)
+    observe_parse(extracted, parsed_items)
+    return parsed_items, total_calories
+
+
+def llm_or_degraded(llm_items, unresolved, catalog):
+    """Tag LLM results, or fall back to the degraded parse when there are none."""
+    if llm_items is None:
+        return [(args, "degraded") for args in parse_segments_degraded(unresolved, catalog)]
+    return [(args, "llm") for args in llm_items]
+
+
+async def aparse_food_log(log_text):
+    """
+    Async version of parse_food_log() for the ASGI view.
+
+    The LLM call and cache reads don't block the event loop; the catalog
+    (re)build and lookups are run in a thread because they may touch the
+    database.
+    """
+    catalog = await sync_to_async(get_catalog)()
+    local_items, unresolved = parse_log_locally(log_text, catalog)
+    
+    extracted = [(args, "local") for args in local_items]
+    if unresolved:
+        llm_items = await aextract_with_llm("\n".join(unresolved))
+        extracted += llm_or_degraded(llm_items, unresolved, catalog)
+    
+    parsed_items, total_calories = await sync_to_async(resolve_extracted)(extracted, catalog)
+    observe_parse(extracted, parsed_items)
+    return parsed_items, total_calories
+
+
+def stream_extraction(log_text):
+    """
+    Streaming version of request_extraction().
+
+    Yields argument dicts one by one, as soon as the model has finished
+    writing each tool call's arguments. Raises LLMDeadlineExceeded once the
+    stream has run for LLM_DEADLINE seconds.
+    """
+    seconds = getattr(settings, 'LLM_DEADLINE', 10)
+    deadline = time.monotonic() + seconds
+    # The SDK timeout bounds each read, so a stalled stream can't outlive the
+    # deadline by more than one read; no SDK retries, as in the guarded path
+    client = get_openai_client().with_options(timeout=seconds, max_retries=0)
+    
+    stream = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=build_llm_messages(log_text),
+        tools=[LOOKUP_TOOL],
+        tool_choice="auto",
+        stream=True
+    )
+    try:
+        yield from _tool_calls_from_stream(stream, deadline, seconds)
+    finally:
+        stream.close()
+
+
+def _tool_calls_from_stream(stream, deadline, seconds):
+    # Tool calls arrive as fragments tagged with an index; once a higher index
+    # shows up (or the stream ends) the previous call is complete.
+    calls = {}
+    current = None
+    for chunk in stream:
+        if time.monotonic() > deadline:
+            raise LLMDeadlineExceeded(f"LLM stream exceeded {seconds}s deadline")
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        for fragment in choice.delta.tool_calls or []:
+            if current is not None and fragment.index != current:
+                args = tool_call_to_args(**calls.pop(current))
+                if args:
+                    yield args
+            current = fragment.index
+            call = calls.setdefault(fragment.index, {"name": "", "arguments": ""})
+            if fragment.function and fragment.function.name:
+                call["name"] += fragment.function.name
+            if fragment.function and fragment.function.arguments:
+                call["arguments"] += fragment.function.arguments
+    
+    for index in sorted(calls):
+        args = tool_call_to_args(**calls[index])
+        if args:
+            yield args
+
+
+def stream_food_log(log_text):
+    """
+    Generator behind the streaming endpoint.
+
+    Yields {"type": "item", ...} events with a running total as each item is
+    resolved, then a final {"type": "done", ...} event with the grand total.
+    Locally parsed and cached items come out before the LLM is even called.
+    """
+    catalog = get_catalog()
+    local_items, unresolved = parse_log_locally(log_text, catalog)
+    state = {"count": 0, "total": 0, "extracted": [], "items": []}
+    
+    def item_event(args, source):
+        items, calories = resolve_extracted([(args, source)], catalog)
+        state["extracted"].append((args, source))
+        if not items:
+            return None
+        state["items"].append(items[0])
+        state["count"] += 1
+        state["total"] += calories
+        return {"type": "item", "item": items[0], "running_total": round(state["total"], 2)}
+    
+    def events_for(extracted, source):
+        for args in extracted:
+            event = item_event(args, source)
+            if event:
+                yield event
+    
+    yield from events_for(local_items, "local")
+    
+    openai_guard = llm_router.guards.get('openai')
+    if unresolved and llm_router.available():
+        llm_text = "\n".join(unresolved)
+        key = cache_key(llm_text, PROMPT_VERSION)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            yield from events_for(cached, "llm")
+        elif (
+            not (os.getenv("OPENAI_API_KEY") and openai_guard)
+            or singleflight.in_flight(key)
+            or not openai_guard.breaker.allow()
+        ):
+            # Only OpenAI streams tool calls; anyone else answers in one go.
+            # An identical extraction already running is joined the same way.
+            llm_items = extract_with_llm(llm_text)
+            for args, source in llm_or_degraded(llm_items, unresolved, catalog):
+                event = item_event(args, source)
+                if event:
+                    yield event
+        else:
+            # Items are sent as they arrive, so there's no hedging here, but
+            # the outcome still feeds the breaker
+            extracted = []
+            streamed = set()
+            with singleflight.lead(key) as flight:
+                try:
+                    for args in stream_extraction(llm_text):
+                        extracted.append(args)
+                        event = item_event(args, "llm")
+                        if event:
+                            streamed.add(event["item"]["item"])
+                            yield event
+                except GeneratorExit:
+                    # The client disconnected mid-stream. Free the breaker's
+                    # half-open trial, or no call would ever be let through again
+                    openai_guard.breaker.release()
+                    raise
+                except Exception as e:
+                    logger.error("LLM stream failed", extra={"error": str(e)})
+                    openai_guard.breaker.record_failure()
+                    flight.set_exception(e)
+                    # Finish with the degraded parse, minus the foods the
+                    # stream already returned
+                    for args, source in llm_or_degraded(None, unresolved, catalog):
+                        if args["food_name"] not in streamed:
+                            event = item_event(args, source)
+                            if event:
+                                yield event
+                else:
+                    openai_guard.breaker.record_success()
+                    llm_tool_calls.observe(len(extracted))
+                    extraction_cache.set(key, extracted, f"openai:{LLM_MODEL}", PROMPT_VERSION)
+                    flight.set_result(extracted)
+    
+    observe_parse(state["extracted"], state["items"])
+    yield {
+        "type": "done",
+        "item_count": state["count"],
+        "total_calories": round(state["total"], 2),
+        "total_nutrients": total_nutrients(state["items"]),
+    }
+
+
+def _extract_in_thread(log_text):
+    try:
+        return extract_with_llm(log_text, raise_errors=True)
+    finally:
+        # Worker threads get their own DB connection (for the cache tier)
+        connection.close()
+
+
+def parse_food_logs(log_texts):
+    """
+    Parse many logs at once for the batch endpoint.
+
+    LLM extractions run concurrently, at most PARSE_BATCH_CONCURRENCY at a
+    time, and every log is resolved against the same catalog snapshot.
+    Returns one result dict per log, in order; a failing log gets
+    {"status": "error"} without affecting the others.
+    """
+    catalog = get_catalog()
+    
+    extracted = []
+    pending = {}
+    leftovers = {}
+    for index, log_text in enumerate(log_texts):
+        local_items, unresolved = parse_log_locally(log_text, catalog)
+        extracted.append([(args, "local") for args in local_items])
+        if unresolved:
+            pending[index] = "\n".join(unresolved)
+            leftovers[index] = unresolved
+    
+    errors = {}
+    if pending:
+        max_workers = min(settings.PARSE_BATCH_CONCURRENCY, len(pending))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # A context per task, so timed() stages inside reach this request's timings
+            futures = {
+                pool.submit(contextvars.copy_context().run, _extract_in_thread, text): index
+                for index, text in pending.items()
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                # An open breaker comes back as None from extract_with_llm()
+                # and is handled by llm_or_degraded(); other errors are raised
+                try:
+                    extracted[index] += llm_or_degraded(future.result(), leftovers[index], catalog)
+                except Exception as e:
+                    errors[index] = str(e)
+    
+    # One catalog lookup for every item of every log
+    flat = [pair for index, items in enumerate(extracted) if index not in errors for pair in items]
+    resolved = iter(lookup_foods_calories([args for args, _ in flat], catalog))
+    
+    results = []
+    for index, items in enumerate(extracted):
+        if index in errors:
+            results.append({"status": "error", "error": errors[index]})
+            continue
+        parsed_items, total_calories = collect_items(items, [next(resolved) for _ in items])
+        observe_parse(items, parsed_items)
+        results.append({
+            "status": "success",
+            "parsed_items": parsed_items,
+            "total_calories": total_calories,
+            "total_nutrients": total_nutrients(parsed_items)
+        })
+    return results
+
+
+# Lines that start a new day or meal in a pasted multi-day log. Short forms
+# ("Sat", "3/5") only count when nothing else follows on the line, so
+# "1/2 cup eba" or "sat down with rice" aren't mistaken for headers.
+DAY_HEADER_RE = re.compile(
+    r'^\s*(?:(?:(?:mon|tues|wednes|thurs|fri|satur|sun)day|day\s*\d+|today|yesterday|\d{4}-\d{2}-\d{2})\b'
+    r'|(?:mon|tue|wed|thu|fri|sat|sun|\d{1,2}[/.]\d{1,2}(?:[/.]\d{2,4})?)(?=\s*(?:[:\-]|$)))',
+    re.IGNORECASE,
+)
+MEAL_HEADER_RE = re.compile(r'^\s*(?:breakfast|brunch|lunch|dinner|supper|snacks?)\b', re.IGNORECASE)
+
+
+def _group_lines(lines, header_re):
+    groups = []
+    for line in lines:
+        if not groups or header_re.match(line):
+            groups.append([])
+        groups[-1].append(line)
+    return groups
+
+
+def _pack(groups, max_chars):
+    """Greedily join consecutive line groups into blocks of at most max_chars."""
+    blocks = []
+    for group in groups:
+        text = "\n".join(group)
+        if blocks and len(blocks[-1]) + len(text) + 1 <= max_chars:
+            blocks[-1] += "\n" + text
+        elif len(text) > max_chars and len(group) > 1:
+            blocks.extend(_pack([[line] for line in group], max_chars))
+        else:
+            blocks.append(text)
+    return blocks
+
+
+def split_log_chunks(log_text, max_chars=None):
+    """
+    Split a long log into independently parseable chunks.
+
+    Every day (a line starting "Monday", "Day 3", "2024-05-01", ...) becomes
+    its own chunk; a day longer than LOG_CHUNK_MAX_CHARS is split further at
+    meal headers, then at line breaks. Returns [{"label", "text"}] in order;
+    a short single-day log comes back as one chunk.
+    """
+    max_chars = max_chars or settings.LOG_CHUNK_MAX_CHARS
+    lines = [line for line in log_text.splitlines() if line.strip()]
+    chunks = []
+    for day in _group_lines(lines, DAY_HEADER_RE):
+        header = DAY_HEADER_RE.match(day[0])
+        label = header.group(0).strip() if header else None
+        for text in _pack(_group_lines(day, MEAL_HEADER_RE), max_chars):
+            chunks.append({"label": label, "text": text})
+    return chunks or [{"label": None, "text": log_text}]
+
+
+def parse_long_food_log(log_text):
+    """
+    parse_food_log() that fans long multi-day logs out in chunks.
+
+    Chunks are extracted in parallel (see parse_food_logs()), so latency
+    follows the longest chunk rather than the whole log, and a failing chunk
+    only loses its own items. Returns (parsed_items, total_calories, chunks)
+    where chunks lists per-chunk subtotals, or is None when the log was
+    parsed in one piece.
+    """
+    chunks = split_log_chunks(log_text)
+    if len(chunks) < 2:
+        return (*parse_food_log(log_text), None)
+
+    parsed_items = []
+    summaries = []
+    for index, (chunk, result) in enumerate(zip(chunks, parse_food_logs([c["text"] for c in chunks]))):
+        summary = {"chunk": index, "label": chunk["label"], "status": result["status"]}
+        if result["status"] == "success":
+            for item in result["parsed_items"]:
+                item["chunk"] = index
+            parsed_items += result["parsed_items"]
+            summary.update(item_count=len(result["parsed_items"]), total_calories=result["total_calories"])
+        else:
+            summary["error"] = result["error"]
+        summaries.append(summary)
+
+    total_calories = round(sum(s.get("total_calories", 0) for s in summaries), 2)
+    return parsed_items, total_calories, summaries
+
+
+async def aparse_long_food_log(log_text):
+    """Async version of parse_long_food_log(); short logs stay fully async."""
+    if len(split_log_chunks(log_text)) < 2:
+        return (*await aparse_food_log(log_text), None)
+    return await sync_to_async(parse_long_food_log)(log_text)
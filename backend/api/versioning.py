@@ -0,0 +1,85 @@
+"""
+Catalog version: a counter plus a content hash of the Food catalog.
+
+The counter is bumped after every committed catalog write (the Food and
+FoodPortion signals, and invalidate_catalog() for bulk writes), which is
+one cheap UPDATE. The content hash covers every food and portion, so it
+costs a full read; it is computed on first use after a bump and stored
+until the next one.
+
+The hash serves as the ETag of GET /foods. Population commands also
+compare it so an unchanged deploy doesn't rewrite the table.
+"""
+
+import hashlib
+import json
+
+from django.db.models import F
+
+
+def catalog_rows():
+    """(name, calories_per_100g, unit, {unit: grams}, {macro: grams}) for every food, by name."""
+    from api.catalog import MACRO_FIELDS
+    from api.models import Food, FoodPortion
+
+    portions = {}
+    for food_id, unit, grams in FoodPortion.objects.order_by('unit').values_list('food_id', 'unit', 'grams'):
+        portions.setdefault(food_id, {})[unit] = grams
+    rows = Food.objects.order_by('name').values_list('id', 'name', 'calories_per_100g', 'unit', *MACRO_FIELDS)
+    for food_id, name, calories, unit, *macros in rows.iterator(chunk_size=5000):
+        yield name, calories, unit, portions.get(food_id, {}), dict(zip(MACRO_FIELDS, macros))
+
+
+def catalog_hash(rows=None):
+    digest = hashlib.sha256()
+    for row in catalog_rows() if rows is None else rows:
+        digest.update(json.dumps(row, sort_keys=True).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def source_hash(data):
+    """Hash of a population command's input (anything JSON-serializable)."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def bump_version():
+    from api.models import CatalogVersion
+
+    if not CatalogVersion.objects.filter(pk=1).update(counter=F('counter') + 1, content_hash=''):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'counter': 1})
+
+
+def current_version():
+    """(counter, content_hash) of the catalog, hashing it if nobody has since the last write."""
+    from api.models import CatalogVersion
+
+    version, _ = CatalogVersion.objects.get_or_create(pk=1)
+    if version.content_hash:
+        return version.counter, version.content_hash
+    content_hash = catalog_hash()
+    # Only store it if no write slipped in while we were hashing
+    CatalogVersion.objects.filter(pk=1, counter=version.counter, content_hash='').update(content_hash=content_hash)
+    return version.counter, content_hash
+
+
+def source_is_current(command, data):
+    """True if `command` already loaded exactly `data` and the catalog hasn't changed since."""
+    from api.models import CatalogSource
+
+    source = CatalogSource.objects.filter(command=command).first()
+    return (
+        source is not None
+        and source.source_hash == source_hash(data)
+        and source.catalog_hash == current_version()[1]
+    )
+
+
+def record_source(command, data):
+    """Remember what `command` loaded; call after its transaction committed."""
+    from api.models import CatalogSource
+
+    CatalogSource.objects.update_or_create(
+        command=command,
+        defaults={'source_hash': source_hash(data), 'catalog_hash': current_version()[1]},
+    )
@@ -1,11 +1,24 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.contrib.auth.models import User
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
 import json
 import logging
-from .utils import parse_food_log
+from .catalog import get_catalog
+from .food_logs import daily_totals, parse_date_range, record_parsed_log
+from .jobs import enqueue_parse_job, queued_response
+from .llm_cache import extraction_cache
+from .llm_clients import client_stats
+from .metrics import registry
+from .misses import missing_foods
+from .providers import llm_router
+from .singleflight import extraction_locks, singleflight
+from .timing import collect_timings, server_timing_header
+from .versioning import catalog_hash, catalog_rows, current_version
+from django.conf import settings
+from .utils import parse_food_logs, parse_long_food_log, stream_food_log, total_nutrients
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +60,78 @@ def get_me(request):
         "email": request.user.email
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_today(request):
+    # Reads the precomputed DailyTotal row; no aggregation over log items
+    day = daily_totals(request.user, *parse_date_range(None, None))[0]
+    return JsonResponse(day)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_daily(request):
+    # /me/daily?start=2024-05-01&end=2024-05-31 (both optional, default today)
+    try:
+        start, end = parse_date_range(request.GET.get('start'), request.GET.get('end'))
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid date range: {e}"}, status=400)
+
+    days = daily_totals(request.user, start, end)
+    return JsonResponse({
+        "days": days,
+        "total_calories": round(sum(day["total_calories"] for day in days), 2)
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny]) # Reference data, nothing per user
+def list_foods(request):
+    # Clients keep the catalog and send its ETag back; while nothing changed
+    # they get an empty 304 for the price of one query
+    counter, content_hash = current_version()
+    etag = f'"{content_hash}"'
+    if_none_match = request.headers.get('If-None-Match', '')
+    if if_none_match.strip() == '*' or etag in [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]:
+        response = HttpResponse(status=304)
+    else:
+        rows = list(catalog_rows())
+        # Hash what we actually send, in case a write landed after current_version()
+        etag = f'"{catalog_hash(rows)}"'
+        response = JsonResponse({
+            "count": len(rows),
+            "foods": [
+                {"name": name, "calories_per_100g": calories, "unit": unit, "portions": portions, **macros}
+                for name, calories, unit, portions, macros in rows
+            ]
+        })
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    response['X-Catalog-Version'] = str(counter)
+    return response
+
+def suggest_foods(request):
+    # Called on every keystroke, so a plain Django view (no DRF auth or
+    # negotiation) answered from the in-memory snapshot without queries
+    if request.method != 'GET':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    index = get_catalog().suggest_index
+    if index is None:
+        return JsonResponse({"error": "Suggestions need the in-memory catalog (FOOD_CATALOG_SNAPSHOT on, no FOOD_CATALOG_INDEX_PATH)."}, status=503)
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+
+    query = request.GET.get('q', '')
+    response = JsonResponse({
+        "query": query,
+        "suggestions": [
+            {"name": entry.name, "calories_per_100g": entry.calories_per_100g, "unit": entry.unit}
+            for entry in index.search(query, limit)
+        ]
+    })
+    response['Cache-Control'] = 'max-age=60'
+    return response
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated]) # Only logged in users can parse
 def parse_log(request):
@@ -56,15 +141,109 @@ def parse_log(request):
             return JsonResponse({"error": "Invalid request. 'foodLog' key is missing."}, status=400)
 
         food_log = data['foodLog']
-        parsed_items, total_calories = parse_food_log(food_log)
+        if request.GET.get('async') in ('1', 'true'):
+            # Hand it to a parse_worker; the client polls the job instead
+            job = enqueue_parse_job(request.user, food_log)
+            return JsonResponse(queued_response(job), status=202)
 
-        return JsonResponse({
+        with collect_timings() as timings:
+            parsed_items, total_calories, chunks = parse_long_food_log(food_log)
+
+        logs = record_parsed_log(request.user, food_log, parsed_items, total_calories, chunks)
+        log_id = logs[0].id if logs else None
+
+        payload = {
             "status": "success",
+            "log_id": log_id,
             "parsed_items": parsed_items,
-            "total_calories": total_calories
+            "total_calories": total_calories,
+            "total_nutrients": total_nutrients(parsed_items)
+        }
+        if chunks:
+            # Multi-day logs are parsed per day; per-chunk subtotals
+            payload["chunks"] = chunks
+        response = JsonResponse(payload, status=200)
+        # e.g. "llm;dur=812.4, lookup;dur=0.3" - shows up in the browser's network tab
+        response['Server-Timing'] = server_timing_header(timings)
+        return response
+
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def parse_log_stream(request):
+    # Newline-delimited JSON: one "item" event per food as soon as it's known, then "done"
+    try:
+        data = json.loads(request.body)
+        if not data or 'foodLog' not in data:
+            return JsonResponse({"error": "Invalid request. 'foodLog' key is missing."}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    lines = (json.dumps(event) + "\n" for event in stream_food_log(data['foodLog']))
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Don't let a proxy hold the stream back
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def parse_log_batch(request):
+    # Body: {"logs": ["...", ...]} or {"logs": [{"id": "2024-05-01", "foodLog": "..."}, ...]}
+    try:
+        data = json.loads(request.body)
+        logs = data.get('logs') if isinstance(data, dict) else None
+        if not isinstance(logs, list) or not logs:
+            return JsonResponse({"error": "Invalid request. 'logs' must be a non-empty list."}, status=400)
+        if len(logs) > settings.PARSE_BATCH_MAX_LOGS:
+            return JsonResponse({"error": f"Too many logs (max {settings.PARSE_BATCH_MAX_LOGS})."}, status=400)
+
+        ids = []
+        texts = []
+        for entry in logs:
+            if isinstance(entry, dict):
+                ids.append(entry.get('id'))
+                entry = entry.get('foodLog')
+            else:
+                ids.append(None)
+            if not isinstance(entry, str):
+                return JsonResponse({"error": "Each log must be a string or have a 'foodLog' string."}, status=400)
+            texts.append(entry)
+
+        results = parse_food_logs(texts)
+        for index, (log_id, result) in enumerate(zip(ids, results)):
+            result["index"] = index
+            if log_id is not None:
+                result["id"] = log_id
+
+        return JsonResponse({
+            "status": "success",
+            "results": results
         }, status=200)
 
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
     except Exception as e:
         return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser]) # Staff only
+def parse_stats(request):
+    # Counters are per worker process, except the db_* totals
+    return JsonResponse({
+        "llm_cache": extraction_cache.stats(),
+        "llm_clients": client_stats(),
+        "llm_providers": llm_router.stats(),
+        "llm_singleflight": {**singleflight.stats(), "file_locks": extraction_locks.stats()},
+        "missing_foods": missing_foods.stats()
+    })
+
+def metrics(request):
+    # Plain Django view: Prometheus scrapers don't carry a JWT
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
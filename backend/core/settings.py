@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -152,3 +153,113 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# --- Food catalog snapshot ---
+# Seconds before a worker re-reads the Food table even without a change signal
+# (changes made by other processes, e.g. management commands, don't reach us).
+FOOD_CATALOG_TTL = int(os.getenv('FOOD_CATALOG_TTL', '300'))
+
+# Fuzzy name matching for foods with no exact catalog entry.
+# 'auto' uses the pg_trgm GIN index on Postgres and an in-memory index otherwise.
+FOOD_FUZZY_BACKEND = os.getenv('FOOD_FUZZY_BACKEND', 'auto')
+FOOD_FUZZY_THRESHOLD = float(os.getenv('FOOD_FUZZY_THRESHOLD', '0.3'))
+
+# --- LLM extraction cache ---
+LLM_CACHE_MEMORY_SIZE = int(os.getenv('LLM_CACHE_MEMORY_SIZE', '1024'))
+LLM_CACHE_MEMORY_TTL = int(os.getenv('LLM_CACHE_MEMORY_TTL', '3600'))
+LLM_CACHE_DB_TTL = int(os.getenv('LLM_CACHE_DB_TTL', str(30 * 24 * 3600)))
+
+# Serve /parse-log with the native async view. Only worth it under an ASGI
+# server (gunicorn -k uvicorn.workers.UvicornWorker core.asgi:application).
+ASYNC_PARSE_LOG = os.getenv('ASYNC_PARSE_LOG', '').lower() in ('1', 'true', 'yes')
+
+# --- Batch parsing (/parse-log/batch) ---
+PARSE_BATCH_MAX_LOGS = int(os.getenv('PARSE_BATCH_MAX_LOGS', '100'))
+# Concurrent LLM extractions per batch request
+PARSE_BATCH_CONCURRENCY = int(os.getenv('PARSE_BATCH_CONCURRENCY', '8'))
+# Long logs are split by day, then meal, into chunks of about this size and
+# extracted in parallel (api.utils.parse_long_food_log)
+LOG_CHUNK_MAX_CHARS = int(os.getenv('LOG_CHUNK_MAX_CHARS', '800'))
+
+# Hold the Food catalog in memory (api.catalog). Turn off to resolve foods with
+# a fixed number of queries per parse instead, e.g. for a very large catalog.
+FOOD_CATALOG_SNAPSHOT = os.getenv('FOOD_CATALOG_SNAPSHOT', '1').lower() in ('1', 'true', 'yes')
+# Memory-mapped catalog file written by `manage.py build_catalog_index`
+# (api.catalog_index). When set and the file exists, every worker looks foods
+# up in the shared mapping instead of holding its own snapshot.
+FOOD_CATALOG_INDEX_PATH = os.getenv('FOOD_CATALOG_INDEX_PATH', '')
+
+# --- LLM HTTP client (api.llm_clients) ---
+# One keep-alive pool per worker process, so TLS handshakes are paid once.
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', '20'))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', '10'))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', '60'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+
+# --- LLM deadline, hedging and circuit breaker (api.resilience, per provider) ---
+# Hard limit for one extraction; past it the parse falls back to a degraded
+# local parse instead of waiting on the SDK's retries.
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '10'))
+# Send a second request when the first is slower than the recent p95.
+LLM_HEDGE = os.getenv('LLM_HEDGE', '').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.5'))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+# Consecutive failures before the breaker opens, and seconds before a retry
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', '30'))
+LLM_CALL_POOL_SIZE = int(os.getenv('LLM_CALL_POOL_SIZE', '32'))
+
+# --- LLM providers (api.providers) ---
+# Tried in this order until each has latency data; after that the router
+# prefers the lowest EWMA latency / error rate. Providers without an API key
+# (OPENAI_API_KEY, GEMINI_API_KEY) are skipped.
+LLM_PROVIDERS = os.getenv('LLM_PROVIDERS', 'openai,gemini')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+LLM_ROUTER_ALPHA = float(os.getenv('LLM_ROUTER_ALPHA', '0.2'))
+LLM_ROUTER_EXPLORE = float(os.getenv('LLM_ROUTER_EXPLORE', '0.05'))
+
+# --- Observability ---
+# Structured JSON logs, written by a background thread (api.log). DEBUG shows
+# the per-item parse details that used to be printed.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {
+            '()': 'api.log.AsyncQueueHandler',
+            'maxsize': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'api': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# --- Coalescing identical in-flight extractions (api.singleflight) ---
+# Lock files used to coordinate gunicorn workers; must be shared by all
+# workers on the host.
+LLM_SINGLEFLIGHT_LOCK_DIR = os.getenv('LLM_SINGLEFLIGHT_LOCK_DIR') or None
+
+# --- Background parse jobs (/parse-log?async=1, manage.py parse_worker) ---
+# Running jobs older than this are assumed lost and retried
+PARSE_JOB_TIMEOUT = int(os.getenv('PARSE_JOB_TIMEOUT', '120'))
+PARSE_JOB_MAX_ATTEMPTS = int(os.getenv('PARSE_JOB_MAX_ATTEMPTS', '3'))
+PARSE_JOB_RETENTION_DAYS = int(os.getenv('PARSE_JOB_RETENTION_DAYS', '7'))
+# Longest ?wait= a status request may long-poll for, and how often it checks.
+# Under sync WSGI workers each waiting poller holds a whole worker, so the
+# default only allows real long-polls with the ASGI server (ASYNC_PARSE_LOG).
+PARSE_JOB_MAX_WAIT = float(os.getenv('PARSE_JOB_MAX_WAIT', '25' if ASYNC_PARSE_LOG else '1'))
+PARSE_JOB_POLL_INTERVAL = float(os.getenv('PARSE_JOB_POLL_INTERVAL', '0.25'))
+
+# --- Unresolved food/unit analytics (api.misses, manage.py missing_foods) ---
+# Misses are counted in memory and written to MissingFood this often (seconds),
+# or sooner once this many distinct names are pending. 0 turns recording off.
+MISS_FLUSH_INTERVAL = float(os.getenv('MISS_FLUSH_INTERVAL', '30'))
+MISS_FLUSH_MAX_KEYS = int(os.getenv('MISS_FLUSH_MAX_KEYS', '1000'))